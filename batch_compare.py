@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from gait_similarity import FEATURE_NAMES, load_sequence_features
+
+# Set in each worker process by _init_worker so the padded features are sent once
+_padded = None
+_lengths = None
+
+
+def pad_features(features_list):
+    """
+    Stack feature sequences of different lengths into one
+    (sequences, max_length, features) array padded with NaN
+    """
+    lengths = np.array([len(features) for features in features_list])
+    padded = np.full((len(features_list), lengths.max(), len(FEATURE_NAMES)), np.nan)
+    for i, features in enumerate(features_list):
+        padded[i, :len(features)] = features
+    return padded, lengths
+
+
+def _similarity_row(i, padded, lengths):
+    """
+    compare_sequences scores of sequence i against every later sequence, for
+    all of them at once. Returns a (later sequences, features) array.
+
+    Like compare_sequences, each pair is truncated to the shorter length: the
+    NaN padding takes care of the other sequence, and running maxima/minima of
+    sequence i give its range over each pair's truncated length.
+    """
+    length = lengths[i]
+    reference = padded[i, :length]
+    others = padded[i + 1:, :length]
+    pair_lengths = np.minimum(lengths[i + 1:], length)
+
+    mean_abs_diff = np.nansum(np.abs(others - reference), axis=1) / pair_lengths[:, None]
+
+    range_others = np.nanmax(others, axis=1) - np.nanmin(others, axis=1)
+    running_max = np.maximum.accumulate(reference, axis=0)
+    running_min = np.minimum.accumulate(reference, axis=0)
+    range_reference = running_max[pair_lengths - 1] - running_min[pair_lengths - 1]
+    range_val = np.maximum(range_reference, range_others)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differences = np.where(range_val > 0, mean_abs_diff / range_val, 0)
+    return 100 * (1 - differences)
+
+
+def _init_worker(padded, lengths):
+    global _padded, _lengths
+    _padded, _lengths = padded, lengths
+
+
+def _similarity_rows_worker(rows):
+    return [(i, _similarity_row(i, _padded, _lengths)) for i in rows]
+
+
+def similarity_matrix(features_list, workers=None):
+    """
+    Compute the full N x N compare_sequences matrix for a set of sequences,
+    featurised once up front.
+
+    Each row is vectorised across all later sequences, and the symmetric lower
+    half is mirrored. With workers > 1, rows are split across processes.
+
+    Returns:
+        tuple: (N, N) overall scores and a dict of (N, N) per-feature scores
+    """
+    padded, lengths = pad_features(features_list)
+    n = len(features_list)
+    per_feature = np.full((n, n, len(FEATURE_NAMES)), 100.0)
+
+    if workers is not None and workers > 1 and n > 2:
+        # Interleave rows so every worker gets a mix of long and short rows
+        chunks = [list(range(w, n - 1, workers)) for w in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(padded, lengths)) as executor:
+            rows = [row for chunk in executor.map(_similarity_rows_worker, chunks) for row in chunk]
+    else:
+        rows = [(i, _similarity_row(i, padded, lengths)) for i in range(n - 1)]
+
+    for i, scores in rows:
+        per_feature[i, i + 1:] = scores
+        per_feature[i + 1:, i] = scores
+
+    overall = per_feature.mean(axis=2)
+    return overall, {name: per_feature[:, :, k] for k, name in enumerate(FEATURE_NAMES)}
+
+
+def export_matrices(output_dir, labels, overall, per_feature):
+    """
+    Write the overall and per-feature matrices as .npy and labelled .csv files
+    """
+    import pandas as pd
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'labels.json'), 'w') as f:
+        json.dump(labels, f, indent=2)
+
+    matrices = {'overall': overall}
+    matrices.update({name.lower().replace(' ', '_'): matrix for name, matrix in per_feature.items()})
+    for name, matrix in matrices.items():
+        np.save(os.path.join(output_dir, f'{name}.npy'), matrix)
+        pd.DataFrame(matrix, index=labels, columns=labels).to_csv(
+            os.path.join(output_dir, f'{name}.csv'), float_format='%.4f'
+        )
+    print(f"Wrote {len(matrices)} similarity matrices for {len(labels)} sequences to {output_dir}")
+
+
+def compare_all(paths, output_dir=None, labels=None, workers=None):
+    """
+    Load and featurise every sequence once, then score all pairs
+    """
+    labels = labels or [os.path.normpath(path) for path in paths]
+    print(f"Loading {len(paths)} sequences...")
+    features_list = [load_sequence_features(path) for path in paths]
+
+    print("Computing similarity matrix...")
+    overall, per_feature = similarity_matrix(features_list, workers=workers)
+
+    if output_dir:
+        export_matrices(output_dir, labels, overall, per_feature)
+    return overall, per_feature
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every pair of gait sequences in a case")
+    parser.add_argument('output_dir', help="Directory to write the similarity matrices to")
+    parser.add_argument('paths', nargs='+', help="Labels folders or keypoint store files")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    compare_all(args.paths, args.output_dir, workers=args.workers)
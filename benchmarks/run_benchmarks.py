@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from batch_compare import similarity_matrix
+from dtw import dtw_search
+from gait_similarity import compare_sequences, compute_gait_features, load_sequence_keypoints, sequence_to_keypoints
+from keypoint_store import write_keypoint_store
+from preprocess import preprocess_videos
+
+# COCO-17 limb connections used to draw the synthetic walker
+SKELETON = [(5, 6), (5, 7), (7, 9), (6, 8), (8, 10), (5, 11), (6, 12), (11, 12),
+            (11, 13), (13, 15), (12, 14), (14, 16), (0, 5), (0, 6)]
+
+RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080)]
+DURATIONS = [3, 10]
+GALLERY_SIZES = [10, 100, 500]
+
+
+def synthetic_keypoints(frames, fps=20, stride_hz=1.0, seed=0):
+    """
+    Procedurally generated walker crossing the frame, as (frames, 17, 3)
+    normalised keypoints with confidence 1. Legs and arms swing sinusoidally
+    at stride_hz; the seed varies body proportions and phase.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(frames) / fps
+    phase = 2 * np.pi * stride_hz * t + rng.uniform(0, 2 * np.pi)
+    height = rng.uniform(0.45, 0.6)
+    hip_half_width = rng.uniform(0.03, 0.05)
+
+    centre_x = 0.2 + 0.6 * (t / max(t[-1], 1e-9) if frames > 1 else t)
+    hip_y = 0.45 + 0.01 * np.sin(2 * phase)
+    thigh, shin = 0.25 * height, 0.25 * height
+    swing = 0.45 * np.sin(phase)
+
+    keypoints = np.zeros((frames, 17, 3))
+    keypoints[..., 2] = 1.0
+
+    def place(index, x, y):
+        keypoints[:, index, 0] = x
+        keypoints[:, index, 1] = y
+
+    shoulder_y = hip_y - 0.3 * height
+    place(0, centre_x, shoulder_y - 0.12 * height)
+    for index in range(1, 5):
+        place(index, centre_x + (index - 2.5) * 0.01, shoulder_y - 0.14 * height)
+    for side, sign in ((0, -1), (1, 1)):
+        leg_swing = swing * (1 if side == 0 else -1)
+        knee_bend = 0.35 * np.clip(np.sin(phase + side * np.pi), 0, None)
+        hip_x = centre_x + sign * hip_half_width
+        knee_x = hip_x + thigh * np.sin(leg_swing)
+        knee_y = hip_y + thigh * np.cos(leg_swing)
+        ankle_x = knee_x + shin * np.sin(leg_swing - knee_bend)
+        ankle_y = knee_y + shin * np.cos(leg_swing - knee_bend)
+        shoulder_x = centre_x + sign * 1.5 * hip_half_width
+        elbow_x = shoulder_x - 0.12 * height * np.sin(leg_swing)
+        place(5 + side, shoulder_x, shoulder_y)
+        place(7 + side, elbow_x, shoulder_y + 0.12 * height)
+        place(9 + side, elbow_x - 0.05 * np.sin(leg_swing), shoulder_y + 0.24 * height)
+        place(11 + side, hip_x, hip_y)
+        place(13 + side, knee_x, knee_y)
+        place(15 + side, ankle_x, ankle_y)
+
+    return keypoints
+
+
+def keypoints_to_rows(keypoints):
+    """(frames, 17, 3) keypoints -> (frames, 56) label rows with a bounding box"""
+    xy = keypoints[..., :2]
+    low, high = xy.min(axis=1), xy.max(axis=1)
+    boxes = np.concatenate([(low + high) / 2, high - low], axis=1)
+    return np.concatenate([np.zeros((len(keypoints), 1)), boxes, keypoints.reshape(len(keypoints), -1)], axis=1)
+
+
+def write_synthetic_video(path, keypoints, size, fps=20):
+    """Render the walker as a stick figure video with cv2.VideoWriter"""
+    width, height = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    scale = np.array([width, height])
+    thickness = max(2, width // 200)
+    for frame_keypoints in keypoints:
+        frame = np.full((height, width, 3), 40, dtype=np.uint8)
+        points = (frame_keypoints[:, :2] * scale).astype(int)
+        for a, b in SKELETON:
+            cv2.line(frame, tuple(points[a]), tuple(points[b]), (230, 230, 230), thickness)
+        cv2.circle(frame, tuple(points[0]), 4 * thickness, (230, 230, 230), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def write_label_folder(folder, rows, stem="synthetic"):
+    """Write rows as YOLO label files, one per frame"""
+    os.makedirs(folder, exist_ok=True)
+    for i, row in enumerate(rows, start=1):
+        with open(os.path.join(folder, f"{stem}_{i}.txt"), 'w') as f:
+            f.write(" ".join(f"{value:.6g}" for value in row) + "\n")
+
+
+def measure(function, repeat=3):
+    """
+    Time a callable and record the peak traced memory of its first run.
+
+    Returns:
+        dict: seconds_min, seconds_median and peak_bytes
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    timings = [time.perf_counter() - start]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return {'seconds_min': min(timings), 'seconds_median': statistics.median(timings), 'peak_bytes': peak}
+
+
+def _quiet(function):
+    """Run a function with stdout discarded (the pipeline prints per video)"""
+    def run():
+        stdout = sys.stdout
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                return function()
+            finally:
+                sys.stdout = stdout
+    return run
+
+
+def run_benchmarks(work_dir, repeat=3, quick=False):
+    results = []
+
+    def record(stage, params, function, stage_repeat=repeat):
+        result = measure(function, stage_repeat)
+        results.append(dict(stage=stage, params=params, **result))
+        print(f"{stage:28s} {json.dumps(params):45s} {result['seconds_median'] * 1000:10.2f} ms "
+              f"{result['peak_bytes'] / 1024 ** 2:8.1f} MiB")
+
+    resolutions = RESOLUTIONS[:1] if quick else RESOLUTIONS
+    durations = DURATIONS[:1] if quick else DURATIONS
+    gallery_sizes = GALLERY_SIZES[:2] if quick else GALLERY_SIZES
+
+    # Preprocessing over synthetic clips
+    for size in resolutions:
+        for duration in durations:
+            video = os.path.join(work_dir, f"walk_{size[0]}x{size[1]}_{duration}s.mp4")
+            write_synthetic_video(video, synthetic_keypoints(30 * duration, fps=30), size, fps=30)
+            output_dir = os.path.join(work_dir, 'processed')
+            params = {'resolution': f"{size[0]}x{size[1]}", 'duration': duration}
+            for streaming in (False, True):
+                record('preprocess_videos', dict(params, streaming=streaming), _quiet(
+                    lambda: preprocess_videos([video], output_dir, streaming=streaming)), stage_repeat=1)
+
+    # Pose inference only when ultralytics and the weights are available offline
+    try:
+        from pose import extract_keypoints, load_pose_model
+        model = load_pose_model() if os.path.exists("yolov8n-pose.pt") else None
+    except ImportError:
+        model = None
+    if model is not None:
+        video = os.path.join(work_dir, "walk_640x360_3s.mp4")
+        record('pose', {'resolution': '640x360', 'duration': 3}, _quiet(
+            lambda: extract_keypoints([video], model=model, save_txt=False)), stage_repeat=1)
+    else:
+        print("Skipping pose: ultralytics or yolov8n-pose.pt not available")
+
+    # Loading keypoints: label folder vs packed store
+    keypoints = synthetic_keypoints(120)
+    rows = keypoints_to_rows(keypoints)
+    labels_dir = os.path.join(work_dir, 'labels')
+    write_label_folder(labels_dir, rows)
+    store_path = os.path.join(work_dir, 'synthetic.gkp')
+    write_keypoint_store(store_path, rows[:, None, :], np.arange(len(rows)))
+    record('load_sequence_keypoints', {'format': 'labels', 'frames': 120},
+           lambda: load_sequence_keypoints(labels_dir))
+    record('load_sequence_keypoints', {'format': 'store', 'frames': 120},
+           lambda: np.asarray(load_sequence_keypoints(store_path)).sum())
+
+    # Feature calculation
+    for frames in (120, 1200):
+        sequence_rows = keypoints_to_rows(synthetic_keypoints(frames))
+        record('compute_gait_features', {'frames': frames},
+               lambda: compute_gait_features(sequence_to_keypoints(sequence_rows)))
+
+    # Comparison: pairwise, all-pairs and gallery search
+    features = [compute_gait_features(synthetic_keypoints(120, seed=seed))[0] for seed in range(max(gallery_sizes))]
+    record('compare_sequences', {'align': None}, lambda: compare_sequences(features[0], features[1]))
+    record('compare_sequences', {'align': 'dtw'}, lambda: compare_sequences(features[0], features[1], align='dtw'))
+    record('compare_sequences', {'align': 'fft', 'spectral': True},
+           lambda: compare_sequences(features[0], features[1], align='fft', spectral=True))
+    for size in gallery_sizes:
+        record('similarity_matrix', {'sequences': size}, lambda: similarity_matrix(features[:size]),
+               stage_repeat=1)
+        record('dtw_search', {'gallery': size, 'k': 5}, lambda: dtw_search(features[0], features[1:size], k=5),
+               stage_repeat=1)
+
+    # End to end, in memory
+    if model is not None:
+        from pipeline import run_pipeline
+        video = os.path.join(work_dir, "walk_640x360_3s.mp4")
+        record('end_to_end', {'resolution': '640x360', 'duration': 3}, _quiet(
+            lambda: run_pipeline([video, video], model=model)), stage_repeat=1)
+
+    return results
+
+
+def compare_results(baseline_path, current_path, threshold=0.2):
+    """
+    Print stages that got slower than the baseline by more than threshold
+    (a fraction). Returns the list of regressions.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r['stage'], json.dumps(r['params'], sort_keys=True)): r for r in json.load(f)['results']}
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    regressions = []
+    for result in current:
+        key = (result['stage'], json.dumps(result['params'], sort_keys=True))
+        if key not in baseline:
+            continue
+        before, after = baseline[key]['seconds_median'], result['seconds_median']
+        change = (after - before) / before if before > 0 else 0
+        marker = "REGRESSION" if change > threshold else ""
+        print(f"{key[0]:28s} {key[1]:45s} {before * 1000:10.2f} -> {after * 1000:10.2f} ms "
+              f"({change:+.0%}) {marker}")
+        if change > threshold:
+            regressions.append({'stage': key[0], 'params': result['params'], 'change': change})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks with synthetic walking videos")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--quick', action='store_true', help="Smallest resolution, length and gallery only")
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare the new results with a previous run")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Slowdown fraction flagged as regression")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='gait_bench_')
+    try:
+        results = run_benchmarks(work_dir, repeat=args.repeat, quick=args.quick)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, f, indent=2)
+    print(f"\nSaved {len(results)} results to {args.output}")
+
+    if args.compare and compare_results(args.compare, args.output, args.threshold):
+        sys.exit(1)
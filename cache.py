@@ -0,0 +1,366 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from gait_similarity import FEATURE_VERSION, compute_gait_features, load_sequence_features, sequence_to_keypoints
+from keypoint_store import STORE_EXTENSION, is_keypoint_store, open_keypoint_store, write_keypoint_store
+
+DEFAULT_CACHE_DIR = '.gait_cache'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+STAGES = ('preprocess', 'keypoints', 'features')
+
+_INDEX_FILE = 'index.json'
+_HASH_CHUNK = 1024 * 1024
+# Cache hits only update access times in memory; they are written at most this often
+ACCESS_FLUSH_SECONDS = 30.0
+
+
+def _digest(parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class GaitCache:
+    """
+    Content-addressed cache of per-video results.
+
+    Entries are keyed on a hash of everything that determines them (video
+    content, model weights, preprocessing parameters, feature version), so a
+    changed input simply misses the cache instead of needing invalidation.
+    Entries are evicted least recently used first once the cache grows past
+    max_bytes.
+
+    Several processes may share one cache directory: every index write
+    merges in the entries other processes have added since. Access times of
+    cache hits are batched; call flush() when done to record them.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+
+        self._index_path = os.path.join(root, _INDEX_FILE)
+        self._index = self._read_index() or {'entries': {}, 'hashes': {}}
+        self._removed = set()
+        self._dirty = False
+        self._saved = time.monotonic()
+        self._lock = threading.RLock()
+
+    def _read_index(self):
+        if not os.path.exists(self._index_path):
+            return None
+        with open(self._index_path) as f:
+            return json.load(f)
+
+    def _save_index(self, merge=True):
+        with self._lock:
+            disk = self._read_index() if merge else None
+            if disk is not None:
+                entries = self._index['entries']
+                for key, entry in disk['entries'].items():
+                    if key in self._removed:
+                        continue
+                    if key not in entries:
+                        entries[key] = entry
+                    else:
+                        entries[key]['last_access'] = max(entries[key]['last_access'], entry['last_access'])
+                # Entries another process has evicted
+                for key in [key for key, entry in entries.items()
+                            if key not in disk['entries'] and not os.path.exists(entry['path'])]:
+                    del entries[key]
+                for path, known in disk['hashes'].items():
+                    self._index['hashes'].setdefault(path, known)
+
+            tmp_path = f"{self._index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, self._index_path)
+            self._removed.clear()
+            self._dirty = False
+            self._saved = time.monotonic()
+
+    def flush(self):
+        """Write access times of cache hits not yet saved"""
+        if self._dirty:
+            self._save_index()
+
+    def file_hash(self, path):
+        """
+        SHA-256 of a file's content, remembered per (path, size, mtime) so
+        unchanged videos and weights are only read once
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            known = self._index['hashes'].get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+                sha.update(chunk)
+        with self._lock:
+            self._index['hashes'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                                           'sha256': sha.hexdigest()}
+            self._save_index()
+        return sha.hexdigest()
+
+    def model_hash(self, model_path):
+        # ultralytics downloads missing weights by name, so fall back to the name
+        return self.file_hash(model_path) if os.path.exists(model_path) else model_path
+
+    def object_path(self, key, extension):
+        return os.path.join(self.root, 'objects', key[:2], key + extension)
+
+    def get(self, key):
+        """Path of a cached object, or None on a miss"""
+        with self._lock:
+            entry = self._index['entries'].get(key)
+            if entry is None or not os.path.exists(entry['path']):
+                return None
+            entry['last_access'] = time.time()
+            self._dirty = True
+            if time.monotonic() - self._saved >= ACCESS_FLUSH_SECONDS:
+                self._save_index()
+            return entry['path']
+
+    def put(self, key, stage, video_hash, extension, write):
+        """
+        Store an object written by write(path) and evict old entries if needed.
+
+        Returns:
+            str: Path of the stored object, or None if it is larger than the
+                whole cache and was not kept
+        """
+        path = self.object_path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a partial object; the extension is kept because
+        # np.save appends .npy to any other name
+        tmp_path = f"{path[:-len(extension)]}.{os.getpid()}.{threading.get_ident()}.tmp{extension}"
+        try:
+            write(tmp_path)
+            size = os.path.getsize(tmp_path)
+            if size > self.max_bytes:
+                return None
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self._index['entries'][key] = {
+                'stage': stage,
+                'video': video_hash,
+                'path': path,
+                'size': size,
+                'last_access': time.time(),
+            }
+            self._removed.discard(key)
+            self.evict(keep=key)
+        return path
+
+    def size(self):
+        return sum(entry['size'] for entry in self._index['entries'].values())
+
+    def evict(self, keep=None):
+        """
+        Drop least recently used entries until the cache fits max_bytes,
+        never the entry keep (the one just stored)
+        """
+        with self._lock:
+            # Include what other processes have stored before deciding
+            self._save_index()
+            total = self.size()
+            by_age = sorted(self._index['entries'].items(), key=lambda item: item[1]['last_access'])
+            for key, entry in by_age:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self._remove(key)
+                total -= entry['size']
+            self._save_index()
+
+    def _remove(self, key):
+        entry = self._index['entries'].pop(key)
+        self._removed.add(key)
+        if os.path.exists(entry['path']):
+            os.remove(entry['path'])
+
+    def invalidate(self, video_path=None, stage=None):
+        """
+        Remove cached entries, optionally only those of one video and/or stage.
+        With neither, the whole cache is cleared.
+
+        Returns:
+            int: Number of entries removed
+        """
+        if video_path is None and stage is None:
+            removed = len(self._index['entries'])
+            shutil.rmtree(os.path.join(self.root, 'objects'), ignore_errors=True)
+            os.makedirs(os.path.join(self.root, 'objects'), exist_ok=True)
+            self._index = {'entries': {}, 'hashes': {}}
+            self._save_index(merge=False)
+            return removed
+
+        video_hash = self.file_hash(video_path) if video_path is not None else None
+        keys = [key for key, entry in self._index['entries'].items()
+                if (video_hash is None or entry['video'] == video_hash)
+                and (stage is None or entry['stage'] == stage)]
+        for key in keys:
+            self._remove(key)
+        self._save_index()
+        return len(keys)
+
+    def stats(self):
+        counts = {stage: 0 for stage in STAGES}
+        for entry in self._index['entries'].values():
+            counts[entry['stage']] += 1
+        return {'entries': len(self._index['entries']), 'bytes': self.size(),
+                'max_bytes': self.max_bytes, 'per_stage': counts}
+
+
+def _video_properties(video_path):
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video file {video_path}")
+    try:
+        return {
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+            'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        cap.release()
+
+
+def cached_video_properties(video_path, cache, target_fps=20, target_duration=6):
+    """
+    Preprocessing metadata of a video (source properties and target frame count)
+    """
+    video_hash = cache.file_hash(video_path)
+    key = _digest({'stage': 'preprocess', 'video': video_hash,
+                   'target_fps': target_fps, 'target_duration': target_duration})
+    path = cache.get(key)
+    if path is None:
+        metadata = dict(_video_properties(video_path), target_fps=target_fps,
+                        target_frame_count=target_fps * target_duration)
+
+        def write(out_path):
+            with open(out_path, 'w') as f:
+                json.dump(metadata, f)
+        cache.put(key, 'preprocess', video_hash, '.json', write)
+        return metadata
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def _keypoints_key(cache, video_path, model_path, target_fps, target_duration):
+    return _digest({'stage': 'keypoints', 'video': cache.file_hash(video_path),
+                    'model': cache.model_hash(model_path),
+                    'target_fps': target_fps, 'target_duration': target_duration})
+
+
+def cached_sequence(video_path, cache, model=None, model_path="yolov8n-pose.pt", target_fps=20,
+                    target_duration=6):
+    """
+    (frames, 56) keypoint rows of a video, running decoding and pose
+    inference only when they are not cached
+    """
+    video_hash = cache.file_hash(video_path)
+    key = _keypoints_key(cache, video_path, model_path, target_fps, target_duration)
+    path = cache.get(key)
+    if path is None:
+        from pipeline import run_pipeline
+
+        cached_video_properties(video_path, cache, target_fps, target_duration)
+        output = run_pipeline([video_path], model=model, model_path=model_path,
+                              target_fps=target_fps, target_duration=target_duration)[0]
+        sequence = output['sequence']
+        cache.put(key, 'keypoints', video_hash, STORE_EXTENSION, lambda out_path: write_keypoint_store(
+            out_path, sequence[:, None, :], np.arange(len(sequence)),
+            metadata={'video': os.path.abspath(video_path), 'model': model_path},
+        ))
+        return sequence
+
+    return open_keypoint_store(path).first_person_rows()
+
+
+def cached_sequence_features(video_path, cache=None, model=None, model_path="yolov8n-pose.pt",
+                             target_fps=20, target_duration=6, min_confidence=None):
+    """
+    Gait features of a video's valid frames, reusing cached features or
+    keypoints whenever the video, model and parameters are unchanged
+    """
+    if cache is None:
+        cache = GaitCache()
+        try:
+            return cached_sequence_features(video_path, cache, model, model_path, target_fps, target_duration,
+                                            min_confidence)
+        finally:
+            cache.flush()
+
+    video_hash = cache.file_hash(video_path)
+    key = _digest({'stage': 'features',
+                   'keypoints': _keypoints_key(cache, video_path, model_path, target_fps, target_duration),
+                   'feature_version': FEATURE_VERSION,
+                   'min_confidence': min_confidence})
+
+    path = cache.get(key)
+    if path is None:
+        sequence = cached_sequence(video_path, cache, model=model, model_path=model_path,
+                                   target_fps=target_fps, target_duration=target_duration)
+        features, valid = compute_gait_features(sequence_to_keypoints(sequence), min_confidence=min_confidence)
+        if not valid.any():
+            raise ValueError(f"No valid frames in {video_path}")
+        cache.put(key, 'features', video_hash, '.npy', lambda out_path: np.save(out_path, features[valid]))
+        return features[valid]
+
+    return np.load(path)
+
+
+def is_video_file(path):
+    """Whether a sequence argument is a video rather than a labels folder or keypoint store"""
+    return os.path.isfile(path) and not is_keypoint_store(path)
+
+
+def load_features(path, cache=None, model=None, model_path="yolov8n-pose.pt", target_fps=20, target_duration=6,
+                  min_confidence=None, track_id=None):
+    """
+    Gait features of a labels folder, keypoint store or video. Videos are
+    only decoded and inferred when their features are not cached yet.
+    """
+    if not is_video_file(path):
+        return load_sequence_features(path, min_confidence=min_confidence, track_id=track_id)
+    if track_id is not None:
+        raise ValueError(f"Error: Selecting a track needs a labels folder or keypoint store, not the video {path}")
+    return cached_sequence_features(path, cache, model=model, model_path=model_path, target_fps=target_fps,
+                                    target_duration=target_duration, min_confidence=min_confidence)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the gait analysis cache")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show cache size and entry counts")
+    invalidate_parser = subparsers.add_parser('invalidate', help="Remove cached entries")
+    invalidate_parser.add_argument('--video', help="Only entries of this video")
+    invalidate_parser.add_argument('--stage', choices=STAGES, help="Only entries of this stage")
+    args = parser.parse_args()
+
+    cache = GaitCache(args.cache_dir)
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    else:
+        removed = cache.invalidate(args.video, args.stage)
+        print(f"Removed {removed} cache entries")
@@ -0,0 +1,196 @@
+import heapq
+
+import numpy as np
+
+# Default Sakoe-Chiba band as a fraction of the longer sequence
+DEFAULT_BAND = 0.1
+
+
+def band_width(n, m, band=DEFAULT_BAND):
+    """
+    Band radius in frames. A float is a fraction of the longer sequence, an
+    int is a number of frames. The band is never narrower than the length
+    difference, otherwise no warping path would exist.
+    """
+    if isinstance(band, float):
+        band = int(round(band * max(n, m)))
+    return max(int(band), abs(n - m))
+
+
+def feature_scale(*feature_arrays):
+    """
+    Per-feature standard deviation used to put lengths and angles on a
+    comparable scale before measuring DTW distances
+    """
+    scale = np.concatenate(feature_arrays).std(axis=0)
+    scale[scale == 0] = 1
+    return scale
+
+
+def _dtw_rows(a, b, w):
+    """
+    Yield the band-limited rows of the cumulative cost matrix.
+
+    Within a row, D[i, j] = min(A[j], D[i, j-1] + c[j]) with
+    A[j] = c[j] + min(D[i-1, j-1], D[i-1, j]); unrolled this is
+    S[j] + min over k <= j of (A[k] - S[k]) with S the running sum of c, which
+    is a single np.minimum.accumulate instead of a Python loop over j.
+    """
+    n, m = len(a), len(b)
+    previous = np.full(m, np.inf)
+    for i in range(n):
+        lo, hi = max(0, i - w), min(m, i + w + 1)
+        cost = np.sum((b[lo:hi] - a[i]) ** 2, axis=1)
+
+        if i == 0:
+            best_prev = np.full(hi - lo, np.inf)
+            best_prev[0] = 0 if lo == 0 else np.inf
+        else:
+            diagonal = np.full(hi - lo, np.inf)
+            if lo > 0:
+                diagonal[:] = previous[lo - 1:hi - 1]
+            else:
+                diagonal[1:] = previous[lo:hi - 1]
+            best_prev = np.minimum(diagonal, previous[lo:hi])
+
+        running = np.cumsum(cost)
+        with np.errstate(invalid='ignore'):
+            row_band = running + np.minimum.accumulate(cost + best_prev - running)
+
+        row = np.full(m, np.inf)
+        row[lo:hi] = row_band
+        yield i, row
+        previous = row
+
+
+def dtw_distance(a, b, band=DEFAULT_BAND):
+    """
+    DTW distance (sum of squared Euclidean costs along the best path) between
+    two (frames, features) arrays, restricted to a Sakoe-Chiba band
+    """
+    w = band_width(len(a), len(b), band)
+    row = None
+    for _, row in _dtw_rows(a, b, w):
+        pass
+    return float(row[-1])
+
+
+def dtw_path(a, b, band=DEFAULT_BAND):
+    """
+    Best banded warping path as an (steps, 2) array of (i, j) index pairs,
+    and its DTW distance
+    """
+    n, m = len(a), len(b)
+    w = band_width(n, m, band)
+    cumulative = np.empty((n, m))
+    for i, row in _dtw_rows(a, b, w):
+        cumulative[i] = row
+
+    i, j = n - 1, m - 1
+    path = [(i, j)]
+    while i > 0 or j > 0:
+        if i == 0:
+            j -= 1
+        elif j == 0:
+            i -= 1
+        else:
+            step = np.argmin([cumulative[i - 1, j - 1], cumulative[i - 1, j], cumulative[i, j - 1]])
+            if step == 0:
+                i, j = i - 1, j - 1
+            elif step == 1:
+                i -= 1
+            else:
+                j -= 1
+        path.append((i, j))
+
+    return np.array(path[::-1]), float(cumulative[-1, -1])
+
+
+def lb_kim(query, candidates):
+    """
+    LB_Kim (first/last frame) lower bound of the DTW distance from query to
+    each candidate. Every warping path starts at (0, 0) and ends at
+    (n-1, m-1), so both costs are always paid.
+    """
+    first = np.array([np.sum((c[0] - query[0]) ** 2) for c in candidates])
+    last = np.array([np.sum((c[-1] - query[-1]) ** 2) if len(c) > 1 or len(query) > 1 else 0.0
+                     for c in candidates])
+    return first + last
+
+
+def envelope(series, w):
+    """Upper and lower Sakoe-Chiba envelopes of a (frames, features) array"""
+    padded = np.pad(series, ((w, w), (0, 0)), mode='edge')
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * w + 1, axis=0)
+    return windows.max(axis=-1), windows.min(axis=-1)
+
+
+def lb_keogh(query, candidates, w):
+    """
+    LB_Keogh lower bound for equal-length candidates, vectorised over a
+    (candidates, frames, features) array. Each candidate frame is matched to
+    some query frame within the band, so its cost is at least its squared
+    distance to the query's envelope.
+    """
+    upper, lower = envelope(query, w)
+    above = np.clip(candidates - upper, 0, None)
+    below = np.clip(lower - candidates, 0, None)
+    return np.sum(above ** 2 + below ** 2, axis=(1, 2))
+
+
+def dtw_search(query, candidates, k=10, band=DEFAULT_BAND, scale=None):
+    """
+    Exact top-k DTW nearest neighbours of a query among candidate sequences.
+
+    Candidates are visited in order of their lower bound (the larger of LB_Kim
+    and, for candidates as long as the query, LB_Keogh). Once a bound exceeds
+    the current k-th best distance, that candidate and every remaining one
+    can be skipped, so the result is identical to an exhaustive scan.
+
+    Args:
+        query (np.ndarray): (frames, features) query sequence
+        candidates (list): (frames, features) candidate sequences
+        k (int): Number of neighbours to return
+        band: Sakoe-Chiba band (fraction of length or frames)
+        scale (np.ndarray): Per-feature divisor applied to every sequence;
+            defaults to the query's feature_scale
+
+    Returns:
+        tuple: List of (candidate index, distance) sorted by distance, and a
+            dict of counters: candidates, pruned_lb_kim, pruned_lb_keogh, full_dtw
+    """
+    scale = feature_scale(query) if scale is None else scale
+    query = query / scale
+    candidates = [np.asarray(c) / scale for c in candidates]
+
+    lower_kim = lb_kim(query, candidates)
+    lower_keogh = np.zeros(len(candidates))
+    same_length = np.array([len(c) == len(query) for c in candidates], dtype=bool)
+    if same_length.any():
+        w = band_width(len(query), len(query), band)
+        stacked = np.stack([c for c, same in zip(candidates, same_length) if same])
+        lower_keogh[same_length] = lb_keogh(query, stacked, w)
+    lower = np.maximum(lower_kim, lower_keogh)
+
+    stats = {'candidates': len(candidates), 'pruned_lb_kim': 0, 'pruned_lb_keogh': 0, 'full_dtw': 0}
+    best = []  # max-heap of (-distance, index)
+
+    order = np.argsort(lower, kind='stable')
+    for position, i in enumerate(order):
+        if len(best) == k and lower[i] > -best[0][0]:
+            # Bounds are visited in increasing order, so everything left is pruned too
+            remaining = order[position:]
+            kim_pruned = int(np.sum(lower_kim[remaining] > -best[0][0]))
+            stats['pruned_lb_kim'] += kim_pruned
+            stats['pruned_lb_keogh'] += len(remaining) - kim_pruned
+            break
+
+        distance = dtw_distance(query, candidates[i], band)
+        stats['full_dtw'] += 1
+        if len(best) < k:
+            heapq.heappush(best, (-distance, i))
+        elif distance < -best[0][0]:
+            heapq.heapreplace(best, (-distance, i))
+
+    results = sorted(((int(i), -d) for d, i in best), key=lambda item: item[1])
+    return results, stats
@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+# Every subcommand imports what it needs when it runs, so a comparison never
+# loads OpenCV, ultralytics, torch or matplotlib unless asked to.
+
+
+def _preprocess(args):
+    from preprocess import preprocess_videos
+
+    preprocess_videos(args.videos, args.output_dir, target_fps=args.fps, target_duration=args.duration,
+                      streaming=args.streaming, workers=args.workers)
+    return {'output_dir': os.path.abspath(args.output_dir),
+            'videos': [os.path.abspath(video) for video in args.videos]}
+
+
+def _extract(args):
+    from pose import extract_keypoints, track_keypoints
+
+    if args.cache:
+        from cache import GaitCache, cached_sequence_features
+        from pose import load_pose_model
+
+        cache = GaitCache(args.cache_dir)
+        model = load_pose_model(args.model, export_format=args.export_format, threads=args.threads, imgsz=args.imgsz)
+        duration = args.duration if args.duration is not None else 6
+        try:
+            frames = [len(cached_sequence_features(video, cache, model=model, model_path=args.model,
+                                                   target_fps=args.fps, target_duration=duration))
+                      for video in args.videos]
+        finally:
+            cache.flush()
+        return {'cache_dir': os.path.abspath(args.cache_dir),
+                'videos': [{'video': os.path.abspath(video), 'valid_frames': count}
+                           for video, count in zip(args.videos, frames)]}
+
+    if args.resample:
+        from resample import extract_resampled_keypoints
+        stores = extract_resampled_keypoints(args.videos, model_path=args.model, output_dir=args.output_dir,
+                                             target_fps=args.fps, target_duration=args.duration, batch=args.batch,
+                                             export_format=args.export_format, threads=args.threads,
+                                             imgsz=args.imgsz)
+        return {'stores': [os.path.abspath(store) for store in stores]}
+
+    if args.track:
+        stores = track_keypoints(args.videos, model_path=args.model, output_dir=args.output_dir,
+                                 export_format=args.export_format, threads=args.threads, imgsz=args.imgsz)
+        return {'stores': [os.path.abspath(store) for store in stores]}
+
+    all_rows = extract_keypoints(args.videos, model_path=args.model, batch=args.batch,
+                                 export_format=args.export_format, threads=args.threads, render=args.render,
+                                 imgsz=args.imgsz)
+    return {'videos': [{'video': os.path.abspath(video), 'frames': len(rows),
+                        'frames_with_person': sum(1 for frame_rows in rows if len(frame_rows))}
+                       for video, rows in zip(args.videos, all_rows)]}
+
+
+def _compare(args):
+    from cache import GaitCache, is_video_file, load_features
+    from gait_similarity import compare_sequences
+    from instrumentation import metrics
+
+    # Videos are scored from cached features, inferring only on a cache miss
+    cache = None
+    if is_video_file(args.sequence1) or is_video_file(args.sequence2):
+        cache = GaitCache(args.cache_dir)
+    try:
+        with metrics.timer('load'):
+            features1 = load_features(args.sequence1, cache, model_path=args.model,
+                                      min_confidence=args.min_confidence, track_id=args.track1)
+            features2 = load_features(args.sequence2, cache, model_path=args.model,
+                                      min_confidence=args.min_confidence, track_id=args.track2)
+    finally:
+        if cache is not None:
+            cache.flush()
+    with metrics.timer('compare'):
+        score, detailed_metrics = compare_sequences(features1, features2, align=args.align, band=args.band,
+                                                    spectral=args.spectral)
+
+    print(f"\nOverall Similarity Score: {score:.2f}%")
+    print("\nDetailed Metrics (higher is more similar):")
+    for feature, value in detailed_metrics.items():
+        print(f"{feature}: {value:.2f}%")
+
+    if args.plot:
+        from gait_similarity import visualize_comparison
+        visualize_comparison(features1, features2)
+    if args.metrics:
+        metrics.export(args.metrics)
+
+    return {
+        'sequence1': os.path.abspath(args.sequence1),
+        'sequence2': os.path.abspath(args.sequence2),
+        'frames': [len(features1), len(features2)],
+        'align': args.align,
+        'score': float(score),
+        'detailed_metrics': {name: float(value) for name, value in detailed_metrics.items()},
+    }
+
+
+def _verify(args):
+    from gait_similarity import load_sequence_keypoints, sequence_to_keypoints
+
+    sequence = load_sequence_keypoints(args.path)
+    keypoints = sequence_to_keypoints(sequence)
+    detected = ~(keypoints[..., :2] == 0).all(axis=2)
+    print(f"Loaded {len(sequence)} frames from {args.path}")
+
+    written = []
+    if args.render:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keypoints_verify'))
+        from render_overlay import render_sequence
+        written = render_sequence(args.path, args.output_dir, video_path=args.video,
+                                  first_frame=args.first_frame)
+    if args.plots:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'keypoints_verify'))
+        from verify_keypoints import verify_keypoints
+        os.makedirs(args.output_dir, exist_ok=True)
+        verify_keypoints(args.path, args.output_dir)
+
+    x, y = keypoints[..., 0][detected], keypoints[..., 1][detected]
+    return {
+        'path': os.path.abspath(args.path),
+        'frames': len(sequence),
+        'values_per_frame': int(sequence.shape[1]),
+        'detected_keypoint_fraction': float(detected.mean()) if detected.size else 0.0,
+        'x_range': [float(x.min()), float(x.max())] if x.size else None,
+        'y_range': [float(y.min()), float(y.max())] if y.size else None,
+        'written': [os.path.abspath(path) for path in written],
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Forensic gait analysis toolchain")
+    parser.add_argument('--json', action='store_true',
+                        help="Print a JSON result on stdout (progress goes to stderr)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    preprocess = subparsers.add_parser('preprocess', help="Resample videos to a fixed frame rate and length")
+    preprocess.add_argument('videos', nargs='+')
+    preprocess.add_argument('--output-dir', default='processed_videos')
+    preprocess.add_argument('--fps', type=int, default=20)
+    preprocess.add_argument('--duration', type=int, default=6)
+    preprocess.add_argument('--streaming', action='store_true', help="Write frames while decoding")
+    preprocess.add_argument('--workers', type=int, help="Process videos in parallel")
+    preprocess.set_defaults(handler=_preprocess)
+
+    extract = subparsers.add_parser('extract', help="Run pose inference and write keypoints")
+    extract.add_argument('videos', nargs='+')
+    extract.add_argument('--model', default='yolov8n-pose.pt')
+    extract.add_argument('--batch', type=int, default=16)
+    extract.add_argument('--export-format', choices=['onnx', 'openvino'])
+    extract.add_argument('--threads', type=int)
+    extract.add_argument('--imgsz', type=int, default=640)
+    extract.add_argument('--render', action='store_true', help="Also write annotated videos")
+    extract.add_argument('--track', action='store_true', help="Track people and write keypoint stores")
+    extract.add_argument('--resample', action='store_true',
+                         help="Infer original videos at native fps and resample the keypoints into stores")
+    extract.add_argument('--cache', action='store_true',
+                         help="Store keypoints and features in the cache for later comparisons")
+    extract.add_argument('--cache-dir', default='.gait_cache')
+    extract.add_argument('--fps', type=int, default=20, help="Analysis frame rate with --resample or --cache")
+    extract.add_argument('--duration', type=float,
+                         help="Seconds to keep (default all with --resample, 6 with --cache)")
+    extract.add_argument('--output-dir', default='keypoints', help="Store directory with --track or --resample")
+    extract.set_defaults(handler=_extract)
+
+    compare = subparsers.add_parser('compare', help="Compare the gait in two sequences")
+    compare.add_argument('sequence1', help="Labels folder, keypoint store or video")
+    compare.add_argument('sequence2', help="Labels folder, keypoint store or video")
+    compare.add_argument('--model', default='yolov8n-pose.pt', help="Pose model for videos not yet cached")
+    compare.add_argument('--cache-dir', default='.gait_cache')
+    compare.add_argument('--align', choices=['dtw', 'fft'], help="Align the sequences before scoring")
+    compare.add_argument('--band', type=float, default=0.1, help="DTW band as a fraction of the length")
+    compare.add_argument('--min-confidence', type=float)
+    compare.add_argument('--spectral', action='store_true',
+                         help="Also compare stride frequency and harmonic ratio")
+    compare.add_argument('--track1', type=int, help="Track ID to use from the first sequence")
+    compare.add_argument('--track2', type=int, help="Track ID to use from the second sequence")
+    compare.add_argument('--plot', action='store_true', help="Show the feature plots")
+    compare.add_argument('--metrics', help="Export stage timings and counters to a file or URL")
+    compare.set_defaults(handler=_compare)
+
+    verify = subparsers.add_parser('verify', help="Check and render a keypoint sequence")
+    verify.add_argument('path', help="Labels folder or keypoint store")
+    verify.add_argument('--output-dir', default=os.path.join('keypoints_verify', 'visualizations'))
+    verify.add_argument('--render', action='store_true', help="Write an overlay MP4 and contact sheet")
+    verify.add_argument('--video', help="Source video to draw the overlay onto")
+    verify.add_argument('--first-frame', type=int, default=1, help="Frame number of the video's first frame")
+    verify.add_argument('--plots', action='store_true', help="Save the matplotlib verification figures")
+    verify.set_defaults(handler=_verify)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # With --json, stdout carries only the result
+    output = sys.stderr if args.json else sys.stdout
+    try:
+        with contextlib.redirect_stdout(output):
+            result = args.handler(args)
+    except Exception as e:
+        if args.json:
+            print(json.dumps({'command': args.command, 'error': str(e)}))
+        else:
+            print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(dict(result, command=args.command), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
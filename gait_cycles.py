@@ -0,0 +1,168 @@
+import numpy as np
+from scipy.signal import find_peaks
+
+from gait_similarity import FEATURE_NAMES
+
+# Samples per time-normalised gait cycle
+CYCLE_SAMPLES = 50
+# Shortest plausible step, in frames, when searching for the stride period
+MIN_STEP_FRAMES = 4
+# Ranges below this are rounding noise from averaging a constant feature
+MIN_RANGE = 1e-9
+
+
+def descriptor_size(samples=CYCLE_SAMPLES):
+    """Mean cycle, per-feature cycle variability, and cycle duration mean/std"""
+    return samples * len(FEATURE_NAMES) + len(FEATURE_NAMES) + 2
+
+
+def estimate_stride_period(step_length, min_period=MIN_STEP_FRAMES):
+    """
+    Stride (gait cycle) period in frames from the autocorrelation of the step
+    length signal. Returns None if the signal shows no periodicity.
+
+    The distance between the ankles peaks once per step, two steps per
+    stride. Left and right steps are rarely identical, so the autocorrelation
+    shows a strong peak at the stride lag and a weaker one at the step lag.
+    The first strong peak is taken as the stride unless no weaker peak sits
+    near half its lag; then the gait is symmetric, the strong peak is the
+    step, and the stride is twice as long.
+    """
+    x = np.asarray(step_length, dtype=np.float64)
+    x = x - x.mean()
+    n = len(x)
+    if n < 2 * min_period or not np.any(x):
+        return None
+
+    spectrum = np.fft.rfft(x, 2 * n)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    autocorrelation /= autocorrelation[0]
+
+    lags, properties = find_peaks(autocorrelation[:n // 2 + 1], height=-np.inf)
+    heights = properties['peak_heights'][lags >= min_period]
+    lags = lags[lags >= min_period]
+    if len(lags) == 0 or heights.max() <= 0:
+        return None
+
+    period = int(lags[np.argmax(heights >= 0.5 * heights.max())])
+    has_step_peak = np.any((lags >= 0.4 * period) & (lags <= 0.6 * period))
+    return period if has_step_peak else 2 * period
+
+
+def detect_gait_cycles(features):
+    """
+    Split a feature sequence into gait cycles.
+
+    Cycles run between successive maxima of the (lightly smoothed) step
+    length, spaced roughly one stride apart, so each cycle covers a left and
+    a right step. Cycles do not overlap.
+
+    Returns:
+        list: (start, end) frame index pairs, end inclusive
+    """
+    step_length = np.asarray(features)[:, 0]
+    period = estimate_stride_period(step_length)
+    if period is None:
+        return []
+
+    window = max(1, period // 8)
+    smoothed = np.convolve(step_length, np.ones(window) / window, mode='same')
+    peaks, _ = find_peaks(smoothed, distance=max(1, int(0.7 * period)))
+    return [(int(start), int(end)) for start, end in zip(peaks[:-1], peaks[1:])]
+
+
+def normalize_cycles(features, cycles, samples=CYCLE_SAMPLES):
+    """
+    Resample every cycle to a fixed number of samples with linear
+    interpolation, for all cycles and features at once.
+
+    Returns:
+        np.ndarray: (cycles, samples, features)
+    """
+    features = np.asarray(features, dtype=np.float64)
+    if not cycles:
+        return np.empty((0, samples, features.shape[1]))
+
+    bounds = np.array(cycles, dtype=np.float64)
+    positions = bounds[:, :1] + (bounds[:, 1:] - bounds[:, :1]) * np.linspace(0, 1, samples)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(features) - 1)
+    weight = (positions - lower)[..., None]
+    return features[lower] * (1 - weight) + features[upper] * weight
+
+
+def cycle_statistics(features, cycles, fps=20):
+    """
+    Per-cycle duration and per-feature mean, standard deviation and range
+    """
+    features = np.asarray(features)
+    statistics = []
+    for start, end in cycles:
+        cycle = features[start:end + 1]
+        statistics.append({
+            'start': start,
+            'end': end,
+            'duration_seconds': (end - start) / fps,
+            'mean': dict(zip(FEATURE_NAMES, cycle.mean(axis=0).tolist())),
+            'std': dict(zip(FEATURE_NAMES, cycle.std(axis=0).tolist())),
+            'range': dict(zip(FEATURE_NAMES, np.ptp(cycle, axis=0).tolist())),
+        })
+    return statistics
+
+
+def cycle_descriptor(features, fps=20, samples=CYCLE_SAMPLES):
+    """
+    Fixed-size descriptor of a sequence's gait, independent of clip length.
+
+    Layout: the mean time-normalised cycle (samples x features, row major),
+    the per-feature cycle-to-cycle standard deviation averaged over the
+    cycle, then the mean and standard deviation of the cycle duration in
+    seconds. When no cycles are found the whole sequence is treated as a
+    single cycle.
+
+    Returns:
+        tuple: (descriptor_size(samples),) descriptor and the per-cycle statistics
+    """
+    features = np.asarray(features, dtype=np.float64)
+    cycles = detect_gait_cycles(features)
+    statistics = cycle_statistics(features, cycles, fps)
+    normalized = normalize_cycles(features, cycles or [(0, len(features) - 1)], samples)
+
+    durations = np.array([s['duration_seconds'] for s in statistics]) if statistics \
+        else np.array([(len(features) - 1) / fps])
+    descriptor = np.concatenate([
+        normalized.mean(axis=0).ravel(),
+        normalized.std(axis=0).mean(axis=0),
+        [durations.mean(), durations.std()],
+    ])
+    return descriptor, statistics
+
+
+def compare_descriptor_batch(descriptor, descriptors, samples=CYCLE_SAMPLES):
+    """
+    compare_sequences-style scores of one descriptor against many, computed
+    on the mean cycles in a single array operation.
+
+    Returns:
+        tuple: (N,) overall scores and (N, features) per-feature scores
+    """
+    n_features = len(FEATURE_NAMES)
+    descriptors = np.atleast_2d(descriptors)
+    query = descriptor[:samples * n_features].reshape(samples, n_features)
+    cycles = descriptors[:, :samples * n_features].reshape(len(descriptors), samples, n_features)
+
+    mean_abs_diff = np.abs(cycles - query).mean(axis=1)
+    range_val = np.maximum(np.ptp(query, axis=0), np.ptp(cycles, axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differences = np.where(range_val > MIN_RANGE, mean_abs_diff / range_val, 0)
+    similarities = 100 * (1 - differences)
+    return similarities.mean(axis=1), similarities
+
+
+def compare_descriptors(descriptor1, descriptor2, samples=CYCLE_SAMPLES):
+    """
+    Compare two sequences by their cycle descriptors in constant time.
+    Returns (overall score, detailed metrics) like compare_sequences.
+    """
+    overall, similarities = compare_descriptor_batch(descriptor1, descriptor2, samples)
+    return float(overall[0]), dict(zip(FEATURE_NAMES, similarities[0].tolist()))
@@ -1,177 +1,191 @@
 import numpy as np
-import pandas as pd
-from scipy.spatial.distance import euclidean
-import matplotlib.pyplot as plt
 import os
+import time
 
-def load_sequence_keypoints(folder_path):
+from dtw import DEFAULT_BAND, dtw_path, feature_scale
+from instrumentation import metrics
+from keypoint_store import (first_person_sequence, is_keypoint_store, open_keypoint_store, read_labels_sequence,
+                            NUM_KEYPOINTS)
+from spectral import cross_correlation_lag, shift_sequences, spectral_features
+
+FEATURE_NAMES = ['Step Length', 'Stance Width', 'Left Knee Angle', 'Right Knee Angle']
+SPECTRAL_NAMES = ['Stride Frequency', 'Harmonic Ratio']
+
+# Bump whenever compute_gait_features changes so cached features are recomputed
+FEATURE_VERSION = 1
+
+# COCO-17 keypoint indices used by the YOLO pose models
+LEFT_HIP, RIGHT_HIP = 11, 12
+LEFT_KNEE, RIGHT_KNEE = 13, 14
+LEFT_ANKLE, RIGHT_ANKLE = 15, 16
+
+def load_sequence_keypoints(folder_path, track_id=None):
     """
-    Load all keypoint files from a folder and arrange them in sequence
+    Load all keypoint files from a folder and arrange them in sequence.
+    A packed keypoint store file is memory-mapped instead, without copying.
+
+    With track_id, only the rows of that tracked person are returned, from
+    every frame where the track was detected, instead of the first person
+    listed in each frame.
     """
-    all_frames = []
-    
-    # Get all txt files in the folder
-    files = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
-    files.sort()  # Ensure files are in sequence
-    
-    for file in files:
-        with open(os.path.join(folder_path, file), 'r') as f:
-            data = f.readline().strip().split()  # Read first line of each file
-            frame_data = [float(x) for x in data]
-            all_frames.append(frame_data)
-    
-    return np.array(all_frames)
+    if track_id is not None:
+        return load_track_keypoints(folder_path, track_id)
+    if is_keypoint_store(folder_path):
+        return open_keypoint_store(folder_path).first_person_rows()
+
+    # Ordered by frame number, not file name (_1, _10, _100, _11, ...)
+    return first_person_sequence(folder_path)
 
-def extract_key_points(sequence_data):
+def load_track_keypoints(path, track_id):
     """
-    Extract relevant keypoints for gait comparison
+    (frames, 56) rows of one track from a tracked keypoint store or a labels
+    folder written while tracking (track ID in the 57th column)
     """
-    print("Frame data shape:", sequence_data.shape)
-    print("Number of values in first frame:", len(sequence_data[0]))
-    
-    relevant_points = []
-    
-    for frame in sequence_data:
-        keypoints = frame[7:]  # All keypoints data
-        
-        if len(relevant_points) == 0:
-            print("First frame keypoints length:", len(keypoints))
-        
-        left_hip_idx = 29
-        right_hip_idx = 31
-        left_knee_idx = 33
-        right_knee_idx = 35
-        left_ankle_idx = 37
-        right_ankle_idx = 39
-        
-        try:
-            frame_points = {
-                'left_hip': (keypoints[left_hip_idx], keypoints[left_hip_idx + 1]),
-                'right_hip': (keypoints[right_hip_idx], keypoints[right_hip_idx + 1]),
-                'left_knee': (keypoints[left_knee_idx], keypoints[left_knee_idx + 1]),
-                'right_knee': (keypoints[right_knee_idx], keypoints[right_knee_idx + 1]),
-                'left_ankle': (keypoints[left_ankle_idx], keypoints[left_ankle_idx + 1]),
-                'right_ankle': (keypoints[right_ankle_idx], keypoints[right_ankle_idx + 1])
-            }
-            relevant_points.append(frame_points)
-        except IndexError as e:
-            print(f"Warning: Frame has insufficient keypoints. Expected indices up to {right_ankle_idx + 1}")
-            print(f"Available keypoints length: {len(keypoints)}")
-            print(f"Frame data: {frame}")
-            raise e
-    
-    return relevant_points
+    if is_keypoint_store(path):
+        return open_keypoint_store(path).track_rows(track_id)[0]
+
+    # Track IDs are only unique within one video
+    frame_rows, frame_track_ids, _ = read_labels_sequence(path)
+    rows = []
+    for person_rows, ids in zip(frame_rows, frame_track_ids):
+        rows.extend(person_rows[ids == track_id])
+    if not rows:
+        raise ValueError(f"Error: Track {track_id} not found in {path}")
+    return np.array(rows)
 
-def calculate_angle(point1, point2, point3):
+def sequence_to_keypoints(sequence_data):
     """
-    Calculate angle between three points with enhanced debugging and validation
+    View (frames, 56) label rows as a (frames, 17, 3) array of (x, y, conf)
     """
-    try:
-        p1 = np.array(point1)
-        p2 = np.array(point2)
-        p3 = np.array(point3)
-        
-        # Validate input points
-        if np.any(np.isnan(p1)) or np.any(np.isnan(p2)) or np.any(np.isnan(p3)):
-            print(f"Warning: NaN values detected in points")
-            return None
-            
-        vector1 = p1 - p2
-        vector2 = p3 - p2
-        
-        # Early validation of vectors
-        if np.allclose(vector1, 0) or np.allclose(vector2, 0):
-            print(f"Warning: Zero vector detected")
-            print(f"Vector1: {vector1}, Vector2: {vector2}")
-            return None
-            
-        # Calculate angle using arctan2 for more stable results
-        angle = np.abs(np.degrees(
-            np.arctan2(np.linalg.norm(np.cross(vector1, vector2)), np.dot(vector1, vector2))
-        ))
-        
-        # Validate angle
-        if not (0 <= angle <= 180):
-            print(f"Warning: Invalid angle calculated: {angle}")
-            return None
-            
-        return angle
-        
-    except Exception as e:
-        print(f"Error in angle calculation: {str(e)}")
-        print(f"Points: {point1}, {point2}, {point3}")
-        return None
+    sequence_data = np.asarray(sequence_data)
+    return sequence_data[:, 5:5 + NUM_KEYPOINTS * 3].reshape(len(sequence_data), NUM_KEYPOINTS, 3)
 
-def calculate_gait_features(points_sequence):
+def _joint_angles(proximal, joint, distal):
     """
-    Calculate key gait features with enhanced error handling
+    Angle in degrees at joint between the two limb segments, for every frame
+    at once. Returns the angles and a mask of frames where either segment has
+    zero length.
     """
-    features = []
-    valid_frames = 0
-    invalid_frames = 0
-    
-    for i, points in enumerate(points_sequence):
-        try:
-            # Calculate basic measurements
-            step_length = euclidean(points['left_ankle'], points['right_ankle'])
-            stance_width = euclidean(points['left_hip'], points['right_hip'])
-            
-            # Calculate angles with validation
-            left_knee_angle = calculate_angle(
-                points['left_hip'],
-                points['left_knee'],
-                points['left_ankle']
-            )
-            
-            right_knee_angle = calculate_angle(
-                points['right_hip'],
-                points['right_knee'],
-                points['right_ankle']
-            )
-            
-            # Validate all measurements
-            if all(x is not None and not np.isnan(x) for x in [step_length, stance_width, left_knee_angle, right_knee_angle]):
-                features.append([step_length, stance_width, left_knee_angle, right_knee_angle])
-                valid_frames += 1
-            else:
-                print(f"\nSkipping frame {i} due to invalid measurements:")
-                print(f"Step length: {step_length}")
-                print(f"Stance width: {stance_width}")
-                print(f"Left knee angle: {left_knee_angle}")
-                print(f"Right knee angle: {right_knee_angle}")
-                invalid_frames += 1
-                
-        except Exception as e:
-            print(f"Error processing frame {i}: {str(e)}")
-            invalid_frames += 1
-            continue
-    
-    if not features:
-        raise ValueError("No valid frames were processed!")
-        
-    features_array = np.array(features)
-    
+    vector1 = proximal - joint
+    vector2 = distal - joint
+    zero_vector = (np.all(np.abs(vector1) <= 1e-8, axis=-1)
+                   | np.all(np.abs(vector2) <= 1e-8, axis=-1))
+    cross = vector1[:, 0] * vector2[:, 1] - vector1[:, 1] * vector2[:, 0]
+    dot = np.einsum('ij,ij->i', vector1, vector2)
+    return np.degrees(np.arctan2(np.abs(cross), dot)), zero_vector
+
+def compute_gait_features(keypoints, min_confidence=None):
+    """
+    Calculate gait features for a whole sequence in a few array operations.
+
+    Uses the COCO-17 hip, knee and ankle keypoints. A frame is invalid when
+    any of those keypoints is NaN, sits at (0, 0) (YOLO's marker for an
+    undetected keypoint), is below min_confidence, or when a knee angle has a
+    zero-length limb segment.
+
+    Args:
+        keypoints (np.ndarray): (frames, 17, 2) or (frames, 17, 3) keypoints
+        min_confidence (float): Minimum keypoint confidence, if the array has one
+
+    Returns:
+        tuple: (frames, 4) features in FEATURE_NAMES order with NaN rows for
+            invalid frames, and a (frames,) boolean validity mask
+    """
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    if keypoints.ndim != 3 or keypoints.shape[1] != NUM_KEYPOINTS or keypoints.shape[2] not in (2, 3):
+        raise ValueError(f"Error: Expected keypoints of shape (frames, 17, 2|3), got {keypoints.shape}")
+
+    start = time.perf_counter()
+    joints = [LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE]
+    xy = keypoints[:, joints, :2]
+
+    missing = np.isnan(xy).any(axis=(1, 2)) | np.all(xy == 0, axis=2).any(axis=1)
+    low_confidence = np.zeros(len(keypoints), dtype=bool)
+    if min_confidence is not None and keypoints.shape[2] == 3:
+        low_confidence = (keypoints[:, joints, 2] < min_confidence).any(axis=1) & ~missing
+
+    left_hip, right_hip, left_knee, right_knee, left_ankle, right_ankle = (xy[:, i] for i in range(6))
+
+    step_length = np.linalg.norm(left_ankle - right_ankle, axis=1)
+    stance_width = np.linalg.norm(left_hip - right_hip, axis=1)
+    left_knee_angle, left_zero = _joint_angles(left_hip, left_knee, left_ankle)
+    right_knee_angle, right_zero = _joint_angles(right_hip, right_knee, right_ankle)
+
+    features = np.stack([step_length, stance_width, left_knee_angle, right_knee_angle], axis=1)
+    invalid = missing | low_confidence
+    zero_vector = (left_zero | right_zero) & ~invalid
+    valid = ~(invalid | zero_vector | np.isnan(features).any(axis=1))
+    features[~valid] = np.nan
+
+    metrics.increment('frames_featurised', int(valid.sum()))
+    for reason, mask in (('missing_keypoint', missing), ('low_confidence', low_confidence),
+                         ('zero_vector', zero_vector)):
+        if mask.any():
+            metrics.increment('frames_rejected', int(mask.sum()), reason=reason)
+    metrics.observe('features', time.perf_counter() - start)
+
+    return features, valid
+
+def load_sequence_features(path, min_confidence=None, track_id=None):
+    """
+    Load a labels folder or keypoint store and return the gait features of
+    its valid frames as a (valid frames, 4) array
+    """
+    keypoints = sequence_to_keypoints(load_sequence_keypoints(path, track_id=track_id))
+    features, valid = compute_gait_features(keypoints, min_confidence=min_confidence)
+    if not valid.any():
+        raise ValueError(f"No valid frames in {path}")
+    return features[valid]
+
+def summarize_gait_features(features, valid):
+    """
+    Print the processing summary and feature statistics for a sequence
+    """
+    valid_features = features[valid]
     print(f"\nProcessing Summary:")
-    print(f"Valid frames: {valid_frames}")
-    print(f"Invalid frames: {invalid_frames}")
-    print(f"Valid frame percentage: {(valid_frames/(valid_frames+invalid_frames))*100:.2f}%")
-    
-    print("\nFeature Statistics:")
-    print("Step Length - Mean:", np.mean(features_array[:, 0]), "Std:", np.std(features_array[:, 0]))
-    print("Stance Width - Mean:", np.mean(features_array[:, 1]), "Std:", np.std(features_array[:, 1]))
-    print("Left Knee Angle - Mean:", np.mean(features_array[:, 2]), "Std:", np.std(features_array[:, 2]))
-    print("Right Knee Angle - Mean:", np.mean(features_array[:, 3]), "Std:", np.std(features_array[:, 3]))
-    
-    return features_array
+    print(f"Valid frames: {int(valid.sum())}")
+    print(f"Invalid frames: {int((~valid).sum())}")
+    print(f"Valid frame percentage: {valid.mean() * 100:.2f}%")
+
+    if len(valid_features):
+        print("\nFeature Statistics:")
+        for name, mean, std in zip(FEATURE_NAMES, valid_features.mean(axis=0), valid_features.std(axis=0)):
+            print(f"{name} - Mean: {mean:.4f}, Std: {std:.4f}")
 
-def compare_sequences(features1, features2):
+def compare_sequences(features1, features2, align=None, band=DEFAULT_BAND, spectral=False):
     """
     Compare two gait sequences with improved normalization
+
+    Args:
+        features1, features2 (np.ndarray): (frames, 4) feature sequences
+        align (str): None compares frame i with frame i after truncating to
+            the shorter sequence; 'dtw' compares the frames paired by a banded
+            DTW warping path, absorbing walking speed and phase differences;
+            'fft' shifts one sequence by the lag of peak FFT cross-correlation,
+            absorbing where in the stride each clip starts
+        band: Sakoe-Chiba band for 'dtw' (fraction of length or frames)
+        spectral (bool): Also report stride frequency and harmonic ratio
+            similarities in the detailed metrics (the overall score stays
+            the mean of the four features)
     """
-    # Ensure sequences are of same length
-    min_length = min(len(features1), len(features2))
-    features1 = features1[:min_length]
-    features2 = features2[:min_length]
+    if spectral:
+        spectra = [spectral_features(features1), spectral_features(features2)]
+
+    if align == 'fft':
+        lag = cross_correlation_lag(features1, features2)
+        features1, features2 = shift_sequences(features1, features2, lag)
+    elif align == 'dtw':
+        scale = feature_scale(features1, features2)
+        path, _ = dtw_path(features1 / scale, features2 / scale, band)
+        features1 = features1[path[:, 0]]
+        features2 = features2[path[:, 1]]
+    elif align is None:
+        # Ensure sequences are of same length
+        min_length = min(len(features1), len(features2))
+        features1 = features1[:min_length]
+        features2 = features2[:min_length]
+    else:
+        raise ValueError(f"Error: Unknown alignment {align}")
     
     # Calculate differences with normalization
     differences = []
@@ -192,10 +206,15 @@ def compare_sequences(features1, features2):
     # Convert to similarity scores
     similarities = 100 * (1 - differences)
     
-    feature_names = ['Step Length', 'Stance Width', 'Left Knee Angle', 'Right Knee Angle']
-    detailed_metrics = dict(zip(feature_names, similarities))
+    detailed_metrics = dict(zip(FEATURE_NAMES, similarities))
     
     overall_score = np.mean(similarities)
+
+    if spectral:
+        for name, value1, value2 in zip(SPECTRAL_NAMES, *spectra):
+            # Left out when either sequence shows no periodicity
+            if np.isfinite(value1) and np.isfinite(value2) and max(value1, value2) > 0:
+                detailed_metrics[name] = 100 * (1 - abs(value1 - value2) / max(value1, value2))
     
     return overall_score, detailed_metrics
 
@@ -203,12 +222,13 @@ def visualize_comparison(features1, features2):
     """
     Visualize the comparison between two gait sequences with simplified plotting
     """
-    feature_names = ['Step Length', 'Stance Width', 'Left Knee Angle', 'Right Knee Angle']
-    
+    # Imported here so comparisons without plots never load matplotlib
+    import matplotlib.pyplot as plt
+
     fig, axes = plt.subplots(2, 2, figsize=(15, 10))
     fig.suptitle('Gait Pattern Comparison', fontsize=16)
     
-    for i, (ax, name) in enumerate(zip(axes.flat, feature_names)):
+    for i, (ax, name) in enumerate(zip(axes.flat, FEATURE_NAMES)):
         frames = range(len(features1[:, i]))
         ax.plot(frames, features1[:, i], label='Person 1', alpha=0.7, linewidth=2)
         ax.plot(frames, features2[:, i], label='Person 2', alpha=0.7, linewidth=2)
@@ -222,30 +242,37 @@ def visualize_comparison(features1, features2):
     plt.tight_layout()
     plt.show()
 
-def main(folder1, folder2):
+def _valid_features(path, features, valid):
+    summarize_gait_features(features, valid)
+    if not valid.any():
+        raise ValueError(f"No valid frames in {path}")
+    return features[valid]
+
+def main(folder1, folder2, metrics_path=None, plot=True):
     """
-    Main function to process and compare two gait sequences
+    Main function to process and compare two gait sequences.
+    The comparison is plotted unless plot is False.
+    Stage timings and frame counters are exported to metrics_path if given
+    (JSON, or Prometheus text for .prom/.txt files and http(s) endpoints).
     """
     try:
         # Load sequences
         print("Loading sequences...")
-        seq1 = load_sequence_keypoints(folder1)
-        seq2 = load_sequence_keypoints(folder2)
-        
-        # Extract relevant points
-        print("\nExtracting keypoints...")
-        points1 = extract_key_points(seq1)
-        points2 = extract_key_points(seq2)
+        with metrics.timer('load'):
+            keypoints1 = sequence_to_keypoints(load_sequence_keypoints(folder1))
+            keypoints2 = sequence_to_keypoints(load_sequence_keypoints(folder2))
         
-        # Calculate features
-        print("\nCalculating gait features for sequence 1...")
-        features1 = calculate_gait_features(points1)
-        print("\nCalculating gait features for sequence 2...")
-        features2 = calculate_gait_features(points2)
+        # Calculate features, exactly as load_sequence_features does
+        with metrics.timer('features'):
+            print("\nCalculating gait features for sequence 1...")
+            features1 = _valid_features(folder1, *compute_gait_features(keypoints1))
+            print("\nCalculating gait features for sequence 2...")
+            features2 = _valid_features(folder2, *compute_gait_features(keypoints2))
         
         # Compare sequences
         print("\nComparing sequences...")
-        similarity_score, detailed_metrics = compare_sequences(features1, features2)
+        with metrics.timer('compare'):
+            similarity_score, detailed_metrics = compare_sequences(features1, features2)
         
         # Print results
         print(f"\nOverall Similarity Score: {similarity_score:.2f}%")
@@ -254,8 +281,12 @@ def main(folder1, folder2):
             print(f"{feature}: {score:.2f}%")
         
         # Visualize comparison
-        print("\nGenerating visualization...")
-        visualize_comparison(features1, features2)
+        if plot:
+            print("\nGenerating visualization...")
+            visualize_comparison(features1, features2)
+        
+        if metrics_path:
+            metrics.export(metrics_path)
         
         return similarity_score, detailed_metrics
         
@@ -265,8 +296,8 @@ def main(folder1, folder2):
 
 if __name__ == "__main__":
     # Configure folders
-    folder1 = r"C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\runs\pose\predict\labels"
-    folder2 = r"C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\runs\pose\predict2\labels"
+    folder1 = os.path.join('runs', 'pose', 'predict', 'labels')
+    folder2 = os.path.join('runs', 'pose', 'predict2', 'labels')
     
     try:
         similarity_score, metrics = main(folder1, folder2)
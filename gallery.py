@@ -0,0 +1,271 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from dtw import DEFAULT_BAND, dtw_search, feature_scale
+from gait_cycles import compare_descriptor_batch, cycle_descriptor, descriptor_size
+from gait_similarity import FEATURE_NAMES, compare_sequences, load_sequence_features
+
+INDEX_FILE = 'index.json'
+DESCRIPTORS_FILE = 'descriptors.npy'
+FEATURES_FILE = 'features.npy'
+OFFSETS_FILE = 'offsets.npy'
+CYCLE_DESCRIPTORS_FILE = 'cycle_descriptors.npy'
+
+# How many descriptor-nearest candidates per requested result get a full comparison
+DEFAULT_PREFILTER_FACTOR = 10
+
+
+def sequence_descriptor(features):
+    """
+    Fixed-size summary of a feature sequence used to pre-filter the gallery:
+    mean, standard deviation and 10th/90th percentiles of each feature
+    """
+    percentiles = np.percentile(features, [10, 90], axis=0)
+    return np.concatenate([features.mean(axis=0), features.std(axis=0), percentiles[0], percentiles[1]])
+
+
+class GalleryIndex:
+    """
+    On-disk gallery of enrolled gait sequences.
+
+    The index directory holds index.json with the entry list, a
+    (entries, descriptor) array for pre-filtering, a dense array of gait
+    cycle descriptors, and every entry's feature sequence concatenated into
+    one array with per-entry offsets, so opening a gallery of thousands of
+    sequences reads five files.
+    """
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        self.entries = []
+        self.descriptors = np.empty((0, 4 * len(FEATURE_NAMES)))
+        self.cycle_descriptors = np.empty((0, descriptor_size()))
+        self.features = np.empty((0, len(FEATURE_NAMES)))
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+        if os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+            with open(os.path.join(index_dir, INDEX_FILE)) as f:
+                self.entries = json.load(f)['entries']
+            self.descriptors = np.load(os.path.join(index_dir, DESCRIPTORS_FILE))
+            self.features = np.load(os.path.join(index_dir, FEATURES_FILE), mmap_mode='r')
+            self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+            cycles_path = os.path.join(index_dir, CYCLE_DESCRIPTORS_FILE)
+            if os.path.exists(cycles_path):
+                self.cycle_descriptors = np.load(cycles_path)
+            else:
+                # Galleries saved before cycle descriptors existed
+                self.cycle_descriptors = np.array([cycle_descriptor(self.entry_features(i))[0]
+                                                   for i in range(len(self.entries))]).reshape(-1, descriptor_size())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def entry_features(self, i):
+        return self.features[self.offsets[i]:self.offsets[i + 1]]
+
+    def enrol(self, sequences):
+        """
+        Add or replace sequences and save the index.
+
+        Args:
+            sequences (list): (entry_id, source, features) tuples
+        """
+        existing = {entry['id']: i for i, entry in enumerate(self.entries)}
+        new_ids = {entry_id for entry_id, _, _ in sequences}
+
+        # Keep untouched entries, then append the new or replaced ones
+        kept = [i for i, entry in enumerate(self.entries) if entry['id'] not in new_ids]
+        entries = [self.entries[i] for i in kept]
+        descriptors = [self.descriptors[i] for i in kept]
+        cycle_descriptors = [self.cycle_descriptors[i] for i in kept]
+        features = [np.array(self.entry_features(i)) for i in kept]
+
+        for entry_id, source, sequence_features in sequences:
+            entries.append({'id': entry_id, 'source': source, 'frames': len(sequence_features)})
+            descriptors.append(sequence_descriptor(sequence_features))
+            cycle_descriptors.append(cycle_descriptor(sequence_features)[0])
+            features.append(np.asarray(sequence_features, dtype=np.float64))
+            action = "Replaced" if entry_id in existing else "Enrolled"
+            print(f"{action} {entry_id} ({len(sequence_features)} frames)")
+
+        self.entries = entries
+        self.descriptors = np.array(descriptors)
+        self.cycle_descriptors = np.array(cycle_descriptors).reshape(-1, descriptor_size())
+        self.offsets = np.concatenate([[0], np.cumsum([len(f) for f in features])]).astype(np.int64)
+        self.features = np.concatenate(features) if features else np.empty((0, len(FEATURE_NAMES)))
+        self.save()
+
+    def save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        np.save(os.path.join(self.index_dir, DESCRIPTORS_FILE), self.descriptors)
+        np.save(os.path.join(self.index_dir, CYCLE_DESCRIPTORS_FILE), self.cycle_descriptors)
+        np.save(os.path.join(self.index_dir, FEATURES_FILE), self.features)
+        np.save(os.path.join(self.index_dir, OFFSETS_FILE), self.offsets)
+        # Written last so a partially saved index is never picked up
+        with open(os.path.join(self.index_dir, INDEX_FILE), 'w') as f:
+            json.dump({'version': 1, 'entries': self.entries}, f, indent=2)
+
+    def prefilter(self, features, n_candidates):
+        """
+        Indices of the n_candidates entries whose descriptors are nearest to
+        the query's, after scaling each descriptor dimension by its spread
+        across the gallery
+        """
+        scale = self.descriptors.std(axis=0)
+        scale[scale == 0] = 1
+        distances = np.linalg.norm((self.descriptors - sequence_descriptor(features)) / scale, axis=1)
+
+        if n_candidates >= len(distances):
+            return np.argsort(distances), distances
+        candidates = np.argpartition(distances, n_candidates)[:n_candidates]
+        return candidates[np.argsort(distances[candidates])], distances
+
+    def query(self, features, k=10, prefilter_factor=DEFAULT_PREFILTER_FACTOR):
+        """
+        Rank gallery entries by similarity to a query sequence.
+
+        Only the descriptor-nearest k * prefilter_factor entries are compared
+        in full with compare_sequences.
+
+        Returns:
+            list: Up to k dicts with 'id', 'source', 'score', 'detailed_metrics'
+                and 'descriptor_distance', most similar first
+        """
+        if not self.entries:
+            return []
+
+        candidates, distances = self.prefilter(features, max(k, k * prefilter_factor))
+        matches = []
+        for i in candidates:
+            score, detailed_metrics = compare_sequences(features, np.asarray(self.entry_features(i)))
+            matches.append({
+                'id': self.entries[i]['id'],
+                'source': self.entries[i]['source'],
+                'score': float(score),
+                'detailed_metrics': {name: float(value) for name, value in detailed_metrics.items()},
+                'descriptor_distance': float(distances[i]),
+            })
+
+        matches.sort(key=lambda match: match['score'], reverse=True)
+        return matches[:k]
+
+    def cycle_query(self, features, k=10):
+        """
+        Rank every gallery entry by its gait cycle descriptor in one array
+        operation, independent of clip lengths.
+
+        Returns:
+            list: Up to k match dicts (as in query), most similar first
+        """
+        if not self.entries:
+            return []
+
+        scores, similarities = compare_descriptor_batch(cycle_descriptor(features)[0], self.cycle_descriptors)
+        top = np.argsort(-scores) if k >= len(scores) else np.argpartition(-scores, k)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{
+            'id': self.entries[i]['id'],
+            'source': self.entries[i]['source'],
+            'score': float(scores[i]),
+            'detailed_metrics': dict(zip(FEATURE_NAMES, similarities[i].tolist())),
+        } for i in top]
+
+    def dtw_query(self, features, k=10, band=DEFAULT_BAND):
+        """
+        Exact top-k gallery search by banded DTW distance, using LB_Kim and
+        LB_Keogh lower bounds to skip most full DTW computations.
+
+        Returns:
+            tuple: Up to k match dicts (as in query, plus 'dtw_distance'),
+                closest first, and the pruning counters from dtw_search
+        """
+        if not self.entries:
+            return [], {'candidates': 0, 'pruned_lb_kim': 0, 'pruned_lb_keogh': 0, 'full_dtw': 0}
+
+        candidates = [self.entry_features(i) for i in range(len(self.entries))]
+        nearest, stats = dtw_search(features, candidates, k=k, band=band, scale=feature_scale(features))
+
+        matches = []
+        for i, distance in nearest:
+            score, detailed_metrics = compare_sequences(features, np.asarray(self.entry_features(i)),
+                                                        align='dtw', band=band)
+            matches.append({
+                'id': self.entries[i]['id'],
+                'source': self.entries[i]['source'],
+                'score': float(score),
+                'detailed_metrics': {name: float(value) for name, value in detailed_metrics.items()},
+                'dtw_distance': distance,
+            })
+        return matches, stats
+
+
+def _entry_id(path):
+    path = os.path.normpath(path)
+    if os.path.basename(path) == 'labels':
+        path = os.path.dirname(path)
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def enrol_sequences(index_dir, paths, ids=None):
+    """
+    Featurise labels folders or keypoint stores and enrol them in the gallery
+    """
+    ids = ids or [_entry_id(path) for path in paths]
+    sequences = [(entry_id, os.path.abspath(path), load_sequence_features(path))
+                 for entry_id, path in zip(ids, paths)]
+    index = GalleryIndex(index_dir)
+    index.enrol(sequences)
+    return index
+
+
+def search_gallery(index_dir, path, k=10, prefilter_factor=DEFAULT_PREFILTER_FACTOR, align=None,
+                   band=DEFAULT_BAND):
+    """
+    Rank the gallery against a scene sequence (labels folder or keypoint store).
+    With align='dtw' the ranking is by DTW distance with lower-bound pruning;
+    with align='cycles' it compares gait cycle descriptors only.
+    """
+    index = GalleryIndex(index_dir)
+    features = load_sequence_features(path)
+    if align == 'dtw':
+        matches, stats = index.dtw_query(features, k=k, band=band)
+        print(f"DTW search: {stats['full_dtw']} of {stats['candidates']} candidates compared in full, "
+              f"{stats['pruned_lb_kim']} pruned by LB_Kim, {stats['pruned_lb_keogh']} by LB_Keogh")
+        return matches
+    if align == 'cycles':
+        return index.cycle_query(features, k=k)
+    return index.query(features, k=k, prefilter_factor=prefilter_factor)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enrol gait sequences in a gallery and search it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enrol_parser = subparsers.add_parser('enrol', help="Add labels folders or keypoint stores to a gallery")
+    enrol_parser.add_argument('index_dir')
+    enrol_parser.add_argument('paths', nargs='+')
+
+    query_parser = subparsers.add_parser('query', help="Rank gallery entries against a scene sequence")
+    query_parser.add_argument('index_dir')
+    query_parser.add_argument('path')
+    query_parser.add_argument('-k', type=int, default=10)
+    query_parser.add_argument('--prefilter-factor', type=int, default=DEFAULT_PREFILTER_FACTOR)
+    query_parser.add_argument('--dtw', action='store_true', help="Rank by banded DTW distance")
+    query_parser.add_argument('--band', type=float, default=DEFAULT_BAND)
+    query_parser.add_argument('--cycles', action='store_true', help="Rank by gait cycle descriptors")
+
+    args = parser.parse_args()
+    if args.command == 'enrol':
+        index = enrol_sequences(args.index_dir, args.paths)
+        print(f"Gallery {args.index_dir} now holds {len(index)} sequences")
+    else:
+        matches = search_gallery(args.index_dir, args.path, k=args.k, prefilter_factor=args.prefilter_factor,
+                                 align='dtw' if args.dtw else 'cycles' if args.cycles else None,
+                                 band=args.band)
+        for rank, match in enumerate(matches, start=1):
+            print(f"\n{rank}. {match['id']}: {match['score']:.2f}%")
+            for feature, score in match['detailed_metrics'].items():
+                print(f"   {feature}: {score:.2f}%")
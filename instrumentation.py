@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('gait_analysis')
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DEFAULT_LOG_INTERVAL = 5.0
+
+
+def configure_logging(log_file='gait_analysis.log', level=logging.INFO):
+    """
+    Send the gait_analysis logger to a file in the same format as gait_analysis.log
+    """
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    return logger
+
+
+class Metrics:
+    """
+    Thread-safe per-stage timers and labelled counters.
+
+    Timers accumulate call count, total and maximum seconds per stage.
+    Counters are keyed by name and labels, e.g.
+    increment('frames_rejected', reason='zero_vector').
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._timers = {}
+            self._counters = {}
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            timer = self._timers.setdefault(stage, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            timer['count'] += 1
+            timer['total_seconds'] += seconds
+            timer['max_seconds'] = max(timer['max_seconds'], seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timers': {stage: dict(timer) for stage, timer in self._timers.items()},
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                             for (name, labels), value in sorted(self._counters.items())],
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self, prefix='gait'):
+        """Render the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+        for metric, field in (('stage_calls_total', 'count'), ('stage_seconds_total', 'total_seconds'),
+                              ('stage_seconds_max', 'max_seconds')):
+            lines.append(f"# TYPE {prefix}_{metric} {'gauge' if metric.endswith('max') else 'counter'}")
+            for stage, timer in sorted(snapshot['timers'].items()):
+                lines.append(f'{prefix}_{metric}{{stage="{stage}"}} {timer[field]}')
+
+        declared = set()
+        for counter in snapshot['counters']:
+            name = f"{prefix}_{counter['name']}_total"
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            labels = ",".join(f'{key}="{value}"' for key, value in sorted(counter['labels'].items()))
+            lines.append(f"{name}{{{labels}}} {counter['value']}" if labels else f"{name} {counter['value']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, destination, fmt=None):
+        """
+        Write the metrics to a file, or POST them to an http(s) endpoint such
+        as a Prometheus Pushgateway. The format ('json' or 'prometheus')
+        defaults to the file extension, or Prometheus for endpoints.
+        """
+        is_endpoint = destination.startswith(('http://', 'https://'))
+        if fmt is None:
+            fmt = 'prometheus' if is_endpoint or destination.endswith(('.prom', '.txt')) else 'json'
+        if fmt == 'json':
+            body, content_type = self.to_json(), 'application/json'
+        elif fmt == 'prometheus':
+            body, content_type = self.to_prometheus(), 'text/plain; version=0.0.4'
+        else:
+            raise ValueError(f"Error: Unknown metrics format {fmt}")
+
+        if is_endpoint:
+            # Imported here: urllib.request loads ssl, which slows every startup
+            import urllib.request
+            request = urllib.request.Request(destination, data=body.encode('utf-8'), method='POST',
+                                             headers={'Content-Type': content_type})
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+        else:
+            directory = os.path.dirname(destination)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(destination, 'w') as f:
+                f.write(body)
+
+
+class RateLimitedLogger:
+    """
+    Emit at most one message per key every interval seconds. The number of
+    suppressed messages is appended to the next one that gets through, so
+    per-frame warnings never flood the console or log file.
+    """
+
+    def __init__(self, target=logger, interval=DEFAULT_LOG_INTERVAL):
+        self.target = target
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last = {}
+        self._suppressed = {}
+
+    def log(self, key, level, message, *args):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, -float('inf')) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+
+        if suppressed:
+            message += f" ({suppressed} similar messages suppressed)"
+        self.target.log(level, message, *args)
+
+
+metrics = Metrics()
+rate_limited_log = RateLimitedLogger()
+
+
+def log_limited(key, level, message, *args):
+    rate_limited_log.log(key, level, message, *args)
+
+
+def export_metrics(destination, fmt=None):
+    metrics.export(destination, fmt)
@@ -0,0 +1,441 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from instrumentation import logger, metrics
+
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+DEFAULT_MAX_PENDING = 64
+# Each job writes its outputs to <output root>/<job ID> unless it names an output_dir
+DEFAULT_OUTPUT_ROOT = 'jobs'
+# Finished jobs kept for status queries before the oldest are forgotten
+JOB_HISTORY = 1000
+
+JOB_TYPES = ('preprocess', 'extract', 'compare')
+# Decoding and inference go to worker processes, comparisons to threads
+# (unless a compared sequence is a video whose features are not cached)
+PROCESS_JOBS = ('preprocess', 'extract')
+DEFAULT_CACHE_DIR = '.gait_cache'
+
+# Pose model settings, the loaded model and the result cache of a worker process
+_worker_config = {}
+_worker_model = None
+_worker_cache = None
+
+
+def _init_worker(model_path, export_format, threads, preload, cache_dir=DEFAULT_CACHE_DIR):
+    _worker_config.update(model_path=model_path, export_format=export_format, threads=threads,
+                          cache_dir=cache_dir)
+    if preload:
+        _pose_model()
+
+
+def _cache():
+    """The worker's result cache, shared on disk with every other worker"""
+    global _worker_cache
+    if _worker_cache is None:
+        from cache import GaitCache
+        _worker_cache = GaitCache(_worker_config.get('cache_dir', DEFAULT_CACHE_DIR))
+    return _worker_cache
+
+
+def _pose_model():
+    """The worker's pose model, loaded on first use and kept for every later job"""
+    global _worker_model
+    if _worker_model is None:
+        from pose import load_pose_model
+        _worker_model = load_pose_model(_worker_config.get('model_path', 'yolov8n-pose.pt'),
+                                        export_format=_worker_config.get('export_format'),
+                                        threads=_worker_config.get('threads'))
+    return _worker_model
+
+
+def run_preprocess_job(params):
+    from preprocess import preprocess_videos
+
+    output_dir = params['output_dir']
+    preprocess_videos(params['videos'], output_dir, target_fps=params.get('target_fps', 20),
+                      target_duration=params.get('target_duration', 6), streaming=True)
+    return {'output_dir': os.path.abspath(output_dir),
+            'videos': [os.path.abspath(os.path.join(output_dir, f"processed_video{i + 1}.mp4"))
+                       for i in range(len(params['videos']))]}
+
+
+def run_extract_job(params):
+    from pose import extract_keypoints, track_keypoints
+
+    output_dir = params['output_dir']
+    if params.get('cache'):
+        from cache import cached_sequence_features
+        cache = _cache()
+        try:
+            frames = [len(cached_sequence_features(video, cache, model=_pose_model(),
+                                                   model_path=_worker_config.get('model_path', 'yolov8n-pose.pt')))
+                      for video in params['videos']]
+        finally:
+            cache.flush()
+        return {'cache_dir': os.path.abspath(cache.root), 'valid_frames': frames}
+
+    if params.get('track'):
+        stores = track_keypoints(params['videos'], model=_pose_model(), output_dir=output_dir)
+        return {'output_dir': os.path.abspath(output_dir),
+                'stores': [os.path.abspath(store) for store in stores]}
+
+    all_rows = extract_keypoints(params['videos'], model=_pose_model(), batch=params.get('batch', 16),
+                                 project=output_dir)
+    labels = [os.path.join(output_dir, os.path.splitext(os.path.basename(video))[0], 'labels')
+              for video in params['videos']]
+    return {'output_dir': os.path.abspath(output_dir),
+            'labels': [os.path.abspath(path) for path in labels],
+            'frames': [len(rows) for rows in all_rows]}
+
+
+def run_compare_job(params):
+    from cache import is_video_file, load_features
+    from gait_similarity import compare_sequences
+
+    paths = [params['sequence1'], params['sequence2']]
+    if any(is_video_file(path) for path in paths):
+        # Only reached in a worker process, see _pool_for
+        cache = _cache()
+        model = _pose_model()
+        model_path = _worker_config.get('model_path', 'yolov8n-pose.pt')
+        try:
+            features1, features2 = [load_features(path, cache, model=model, model_path=model_path,
+                                                  min_confidence=params.get('min_confidence'))
+                                    for path in paths]
+        finally:
+            cache.flush()
+    else:
+        features1, features2 = [load_features(path, min_confidence=params.get('min_confidence')) for path in paths]
+    score, detailed_metrics = compare_sequences(features1, features2, align=params.get('align'),
+                                                spectral=params.get('spectral', False))
+    return {'score': float(score),
+            'detailed_metrics': {name: float(value) for name, value in detailed_metrics.items()}}
+
+
+JOB_FUNCTIONS = {
+    'preprocess': run_preprocess_job,
+    'extract': run_extract_job,
+    'compare': run_compare_job,
+}
+
+
+class JobService:
+    """
+    Asynchronous local job server speaking JSON lines over TCP or a Unix socket.
+
+    Each request is one JSON object per line with an 'op' of submit, status,
+    cancel or stats, and gets one JSON line back. Submitted jobs wait in a
+    queue per pool. Preprocess and extract jobs run in worker processes that
+    keep one pose model loaded for their lifetime; compare jobs run in a
+    thread pool. Submissions are refused with 'busy' once max_pending jobs
+    are queued, so callers back off instead of piling up work.
+    """
+
+    def __init__(self, process_workers=None, thread_workers=4, max_pending=DEFAULT_MAX_PENDING,
+                 model_path="yolov8n-pose.pt", export_format=None, threads=None, preload=False,
+                 output_root=DEFAULT_OUTPUT_ROOT, cache_dir=DEFAULT_CACHE_DIR):
+        self.process_workers = process_workers or os.cpu_count() or 1
+        self.thread_workers = thread_workers
+        self.max_pending = max_pending
+        self.output_root = output_root
+        self._pool_args = (model_path, export_format, threads, preload, cache_dir)
+
+        self.jobs = OrderedDict()
+        self._queues = {}
+        self._process_pool = None
+        self._thread_pool = None
+        self._server = None
+        self._dispatchers = []
+        self._connections = set()
+
+    async def start(self, address=DEFAULT_ADDRESS):
+        self._process_pool = ProcessPoolExecutor(self.process_workers, initializer=_init_worker,
+                                                 initargs=self._pool_args)
+        self._thread_pool = ThreadPoolExecutor(self.thread_workers)
+        self._queues = {'process': asyncio.Queue(), 'thread': asyncio.Queue()}
+        self._dispatchers = (
+            [asyncio.create_task(self._dispatch('process', self._process_pool))
+             for _ in range(self.process_workers)]
+            + [asyncio.create_task(self._dispatch('thread', self._thread_pool))
+               for _ in range(self.thread_workers)]
+        )
+
+        if _is_unix_address(address):
+            if os.path.exists(address):
+                os.remove(address)
+            self._server = await asyncio.start_unix_server(self._handle, path=address)
+        else:
+            host, port = _split_address(address)
+            self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info("Job service listening on %s", address)
+        print(f"Job service listening on {address} ({self.process_workers} worker processes, "
+              f"{self.thread_workers} threads)")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Open client connections are not closed by the server
+        tasks = list(self._dispatchers) + list(self._connections)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._thread_pool.shutdown(wait=False, cancel_futures=True)
+        self._process_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def serve_forever(self, address=DEFAULT_ADDRESS):
+        await self.start(address)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    def pending(self):
+        """Jobs waiting for a worker (cancelled jobs still in a queue are not counted)"""
+        return sum(1 for job in self.jobs.values() if job['state'] == 'queued')
+
+    def submit(self, job_type, params):
+        if job_type not in JOB_TYPES:
+            return {'ok': False, 'error': f"Unknown job type {job_type}"}
+        if self.pending() >= self.max_pending:
+            metrics.increment('jobs_rejected', type=job_type)
+            return {'ok': False, 'error': 'busy', 'pending': self.pending()}
+
+        job_id = uuid.uuid4().hex[:12]
+        if job_type in PROCESS_JOBS:
+            # Concurrent jobs never share an output directory
+            params = dict(params, output_dir=params.get('output_dir') or os.path.join(self.output_root, job_id))
+        job = {'id': job_id, 'type': job_type, 'params': params, 'state': 'queued',
+               'submitted': time.time(), 'started': None, 'finished': None, 'result': None, 'error': None}
+        self.jobs[job['id']] = job
+        self._forget_old_jobs()
+        self._queues[_pool_for(job_type, params)].put_nowait(job['id'])
+        metrics.increment('jobs_submitted', type=job_type)
+        return {'ok': True, 'job_id': job['id'], 'pending': self.pending()}
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {'ok': False, 'error': f"Unknown job {job_id}"}
+        return dict({key: value for key, value in job.items() if key != 'params'}, ok=True)
+
+    def cancel(self, job_id):
+        """Cancel a queued job. Running jobs cannot be interrupted."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {'ok': False, 'error': f"Unknown job {job_id}"}
+        if job['state'] != 'queued':
+            return {'ok': False, 'error': f"Job is {job['state']}", 'state': job['state']}
+        job['state'] = 'cancelled'
+        job['finished'] = time.time()
+        metrics.increment('jobs_finished', type=job['type'], state='cancelled')
+        return {'ok': True, 'state': 'cancelled'}
+
+    def stats(self):
+        states = {}
+        for job in self.jobs.values():
+            states[job['state']] = states.get(job['state'], 0) + 1
+        return {'ok': True, 'pending': self.pending(), 'max_pending': self.max_pending,
+                'states': states, 'process_workers': self.process_workers,
+                'thread_workers': self.thread_workers}
+
+    def _forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['finished'] is not None]
+        for job_id in finished[:max(0, len(self.jobs) - JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    async def _dispatch(self, queue_name, pool):
+        """Run queued jobs one at a time, so each dispatcher keeps one worker busy"""
+        loop = asyncio.get_running_loop()
+        queue = self._queues[queue_name]
+        while True:
+            job = self.jobs.get(await queue.get())
+            if job is None or job['state'] != 'queued':
+                continue
+
+            job['state'] = 'running'
+            job['started'] = time.time()
+            try:
+                job['result'] = await loop.run_in_executor(pool, JOB_FUNCTIONS[job['type']], job['params'])
+                job['state'] = 'done'
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                job['state'] = 'failed'
+                job['error'] = f"{type(e).__name__}: {e}"
+                logger.error("Job %s (%s) failed: %s", job['id'], job['type'], job['error'])
+            job['finished'] = time.time()
+            metrics.increment('jobs_finished', type=job['type'], state=job['state'])
+            metrics.observe(f"job_{job['type']}", job['finished'] - job['started'])
+
+    def _handle_request(self, request):
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': "Bad request: expected a JSON object"}
+        op = request.get('op')
+        if op == 'submit':
+            job_type, params = request.get('type'), request.get('params', {})
+            if not isinstance(job_type, str) or job_type not in JOB_TYPES:
+                return {'ok': False, 'error': f"Unknown job type {job_type}"}
+            if not isinstance(params, dict):
+                return {'ok': False, 'error': "Bad request: params must be a JSON object"}
+            return self.submit(job_type, params)
+        if op in ('status', 'cancel'):
+            job_id = request.get('job_id')
+            if not isinstance(job_id, str):
+                return {'ok': False, 'error': f"Unknown job {job_id}"}
+            return getattr(self, op)(job_id)
+        if op == 'stats':
+            return self.stats()
+        return {'ok': False, 'error': f"Unknown op {op}"}
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = self._handle_request(json.loads(line))
+                except json.JSONDecodeError as e:
+                    response = {'ok': False, 'error': f"Bad request: {e}"}
+                writer.write((json.dumps(response) + '\n').encode('utf-8'))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+
+def _pool_for(job_type, params):
+    """Comparisons involving a video may need pose inference, so they go to the workers"""
+    if job_type in PROCESS_JOBS:
+        return 'process'
+    from cache import is_video_file
+    if any(isinstance(params.get(name), str) and is_video_file(params[name]) for name in ('sequence1', 'sequence2')):
+        return 'process'
+    return 'thread'
+
+
+def _is_unix_address(address):
+    return os.sep in address or address.endswith('.sock')
+
+
+def _split_address(address):
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class ServiceClient:
+    """Blocking client for a running JobService"""
+
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=30):
+        if _is_unix_address(address):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(address)
+        else:
+            self._socket = socket.create_connection(_split_address(address), timeout=timeout)
+        self._file = self._socket.makefile('rwb')
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, **payload):
+        self._file.write((json.dumps(payload) + '\n').encode('utf-8'))
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Job service closed the connection")
+        return json.loads(line)
+
+    def submit(self, job_type, **params):
+        return self.request(op='submit', type=job_type, params=params)
+
+    def status(self, job_id):
+        return self.request(op='status', job_id=job_id)
+
+    def cancel(self, job_id):
+        return self.request(op='cancel', job_id=job_id)
+
+    def stats(self):
+        return self.request(op='stats')
+
+    def wait(self, job_id, poll_interval=0.2, timeout=None):
+        """Poll until a job has finished, failed or been cancelled"""
+        start = time.monotonic()
+        while True:
+            status = self.status(job_id)
+            if not status['ok'] or status['state'] in ('done', 'failed', 'cancelled'):
+                return status
+            if timeout is not None and time.monotonic() - start > timeout:
+                return status
+            time.sleep(poll_interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local gait analysis job service")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help="host:port or a Unix socket path")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help="Run the service")
+    serve.add_argument('--process-workers', type=int)
+    serve.add_argument('--thread-workers', type=int, default=4)
+    serve.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING)
+    serve.add_argument('--model', default='yolov8n-pose.pt')
+    serve.add_argument('--export-format', choices=['onnx', 'openvino'])
+    serve.add_argument('--threads', type=int, help="Intra-op threads per worker process")
+    serve.add_argument('--preload', action='store_true', help="Load the pose model when workers start")
+    serve.add_argument('--output-root', default=DEFAULT_OUTPUT_ROOT, help="Directory for per-job outputs")
+    serve.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Result cache shared by the workers")
+
+    submit = subparsers.add_parser('submit', help="Submit a job and print its ID")
+    submit.add_argument('type', choices=JOB_TYPES)
+    submit.add_argument('paths', nargs='+', help="Videos, or the two sequences to compare")
+    submit.add_argument('--wait', action='store_true', help="Wait for the result")
+
+    for name in ('status', 'cancel'):
+        subparsers.add_parser(name).add_argument('job_id')
+    subparsers.add_parser('stats')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        service = JobService(args.process_workers, args.thread_workers, args.max_pending, args.model,
+                             args.export_format, args.threads, args.preload, args.output_root, args.cache_dir)
+        try:
+            asyncio.run(service.serve_forever(args.address))
+        except KeyboardInterrupt:
+            pass
+    else:
+        with ServiceClient(args.address) as client:
+            if args.command == 'submit':
+                if args.type == 'compare':
+                    if len(args.paths) != 2:
+                        parser.error("compare needs exactly two sequences")
+                    response = client.submit('compare', sequence1=args.paths[0], sequence2=args.paths[1])
+                else:
+                    response = client.submit(args.type, videos=args.paths)
+                if args.wait and response['ok']:
+                    response = client.wait(response['job_id'])
+            elif args.command == 'stats':
+                response = client.stats()
+            else:
+                response = getattr(client, args.command)(args.job_id)
+        print(json.dumps(response, indent=2))
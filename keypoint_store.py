@@ -0,0 +1,319 @@
+import json
+import os
+import re
+from collections import defaultdict
+
+import numpy as np
+
+# File layout: magic, little-endian uint64 header length, JSON header, then
+# each array as raw little-endian data at a 64-byte aligned offset so that it
+# can be memory-mapped directly.
+MAGIC = b"GAITKPS1"
+STORE_EXTENSION = ".gkp"
+ROW_LENGTH = 56  # class, xywh box, 17 x (x, y, conf) as in the YOLO label files
+NUM_KEYPOINTS = 17
+NO_TRACK = -1  # track_id of padding rows and of detections the tracker left unassigned
+_ALIGNMENT = 64
+
+_LABEL_FILE_PATTERN = re.compile(r"^(?P<stem>.+)_(?P<frame>\d+)\.txt$")
+
+
+def _aligned(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def write_keypoint_store(path, rows, frame_index, metadata=None, **extra_arrays):
+    """
+    Write one sequence to a packed keypoint store file.
+
+    Args:
+        path (str): Output file (conventionally ending in .gkp)
+        rows (np.ndarray): (frames, persons, 56) label rows, NaN where a frame
+            has fewer persons than the widest frame
+        frame_index (np.ndarray): (frames,) source frame number of each row
+        metadata (dict): JSON-serialisable information about the sequence
+        **extra_arrays: Additional per-frame arrays to store alongside
+    """
+    rows = np.ascontiguousarray(rows, dtype="<f4")
+    if rows.ndim != 3 or rows.shape[2] != ROW_LENGTH:
+        raise ValueError(f"Error: Expected rows of shape (frames, persons, {ROW_LENGTH}), got {rows.shape}")
+
+    frame_index = np.ascontiguousarray(frame_index, dtype="<i4")
+    if len(frame_index) != len(rows):
+        raise ValueError("Error: frame_index must have one entry per frame")
+
+    person_count = np.ascontiguousarray((~np.isnan(rows[:, :, 0])).sum(axis=1), dtype="<i2")
+
+    arrays = {'rows': rows, 'frame_index': frame_index, 'person_count': person_count}
+    for name, array in extra_arrays.items():
+        array = np.asarray(array)
+        arrays[name] = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+
+    # The header stores offsets relative to the start of the data section so it
+    # does not depend on its own length
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+
+    header = json.dumps({'version': 1, 'arrays': layout, 'metadata': metadata or {}}).encode("utf-8")
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+class KeypointStore:
+    """
+    Read-only, memory-mapped view of a packed keypoint sequence.
+
+    Nothing is read until an array is accessed, and every array returned is
+    a view onto the mapped file rather than a copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Error: {path} is not a keypoint store file")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+
+        self.metadata = header['metadata']
+        self._layout = header['arrays']
+        self._data_start = _aligned(len(MAGIC) + 8 + header_length)
+        self._arrays = {}
+
+    def __len__(self):
+        return self._layout['frame_index']['shape'][0]
+
+    def __contains__(self, name):
+        return name in self._layout
+
+    def array(self, name):
+        """Memory-map one stored array"""
+        if name not in self._arrays:
+            spec = self._layout[name]
+            shape = tuple(spec['shape'])
+            if 0 in shape:
+                self._arrays[name] = np.empty(shape, dtype=spec['dtype'])
+            else:
+                self._arrays[name] = np.memmap(self.path, dtype=spec['dtype'], mode="r",
+                                               offset=self._data_start + spec['offset'], shape=shape)
+        return self._arrays[name]
+
+    @property
+    def rows(self):
+        """(frames, persons, 56) label rows"""
+        return self.array('rows')
+
+    @property
+    def frame_index(self):
+        return self.array('frame_index')
+
+    @property
+    def person_count(self):
+        return self.array('person_count')
+
+    @property
+    def keypoints(self):
+        """(frames, persons, 17, 3) keypoints as (x, y, conf), a view onto rows"""
+        rows = self.rows
+        return rows[..., 5:].reshape(rows.shape[:2] + (NUM_KEYPOINTS, 3))
+
+    @property
+    def boxes(self):
+        """(frames, persons, 4) normalised xywh boxes, a view onto rows"""
+        return self.rows[..., 1:5]
+
+    @property
+    def track_id(self):
+        """(frames, persons) track ID of each row, or None if the sequence was not tracked"""
+        return self.array('track_id') if 'track_id' in self else None
+
+    def track_ids(self):
+        """Sorted IDs of the tracks present in the sequence"""
+        if self.track_id is None:
+            return []
+        ids = np.unique(self.track_id)
+        return ids[ids != NO_TRACK].tolist()
+
+    def track_rows(self, track_id):
+        """
+        (frames, 56) rows and (frames,) frame numbers of one track, in frame
+        order, skipping frames where the track was not detected
+        """
+        if self.track_id is None:
+            raise ValueError(f"Error: {self.path} has no track IDs")
+        frame_pos, slot = np.nonzero(self.track_id == track_id)
+        return self.rows[frame_pos, slot], self.frame_index[frame_pos]
+
+    def first_person_rows(self):
+        """
+        (frames, 56) rows of the first listed person in each frame, the same
+        data load_sequence_keypoints reads from the first line of each label file
+        """
+        return self.rows[:, 0, :]
+
+
+def open_keypoint_store(path):
+    return KeypointStore(path)
+
+
+def is_keypoint_store(path):
+    """Check whether a path points at a keypoint store file rather than a labels folder"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def pack_frame_rows(frame_rows):
+    """
+    Pad a list of per-frame (n_persons, 56) arrays into one
+    (frames, max_persons, 56) array, filling missing persons with NaN
+    """
+    max_persons = max((len(rows) for rows in frame_rows), default=0)
+    packed = np.full((len(frame_rows), max(max_persons, 1), ROW_LENGTH), np.nan, dtype=np.float32)
+    for i, rows in enumerate(frame_rows):
+        if len(rows):
+            packed[i, :len(rows)] = np.asarray(rows, dtype=np.float32)[:, :ROW_LENGTH]
+    return packed
+
+
+def pack_frame_track_ids(frame_track_ids, persons):
+    """
+    Pad a list of per-frame (n_persons,) track ID arrays into one
+    (frames, persons) int32 array, filling missing persons with NO_TRACK
+    """
+    packed = np.full((len(frame_track_ids), persons), NO_TRACK, dtype=np.int32)
+    for i, ids in enumerate(frame_track_ids):
+        if len(ids):
+            packed[i, :len(ids)] = ids
+    return packed
+
+
+def _group_label_files(labels_dir):
+    """Group YOLO label files by video stem, sorted by frame number"""
+    groups = defaultdict(list)
+    for name in os.listdir(labels_dir):
+        match = _LABEL_FILE_PATTERN.match(name)
+        if match:
+            groups[match.group('stem')].append((int(match.group('frame')), name))
+    return {stem: sorted(files) for stem, files in groups.items()}
+
+
+def read_labels_folder(labels_dir):
+    """
+    Read every person of every label file in a YOLO labels folder.
+
+    Label files written while tracking carry the track ID as a 57th column;
+    frames without it get NO_TRACK.
+
+    Returns:
+        dict: Video stem -> (frame_rows, frame_track_ids, frame_index), with
+            per-frame (n_persons, 56) rows and (n_persons,) track IDs for the
+            frames that have detections, ordered by frame number
+    """
+    videos = {}
+    for stem, files in sorted(_group_label_files(labels_dir).items()):
+        frame_rows = []
+        frame_track_ids = []
+        frame_index = []
+        for frame, name in files:
+            rows = np.loadtxt(os.path.join(labels_dir, name), dtype=np.float32, ndmin=2)
+            if rows.size == 0:
+                continue
+            frame_rows.append(rows[:, :ROW_LENGTH])
+            if rows.shape[1] > ROW_LENGTH:
+                frame_track_ids.append(rows[:, ROW_LENGTH].astype(np.int32))
+            else:
+                frame_track_ids.append(np.full(len(rows), NO_TRACK, dtype=np.int32))
+            frame_index.append(frame)
+        videos[stem] = (frame_rows, frame_track_ids, np.array(frame_index, dtype=np.int32))
+    return videos
+
+
+def read_labels_sequence(labels_dir):
+    """
+    read_labels_folder for a folder holding the labels of exactly one video
+
+    Returns:
+        tuple: (frame_rows, frame_track_ids, frame_index), ordered by frame number
+    """
+    videos = read_labels_folder(labels_dir)
+    if len(videos) != 1:
+        raise ValueError(f"Error: Expected the labels of one video in {labels_dir}, found {len(videos)}")
+    return next(iter(videos.values()))
+
+
+def first_person_sequence(labels_dir):
+    """
+    (frames, 56) rows of the first listed person in each frame of a labels
+    folder, ordered by frame number like the keypoint store built from it
+    """
+    frame_rows = read_labels_sequence(labels_dir)[0]
+    if not frame_rows:
+        return np.empty((0, ROW_LENGTH), dtype=np.float32)
+    return np.stack([rows[0] for rows in frame_rows])
+
+
+def convert_labels_folder(labels_dir, output_dir, metadata=None):
+    """
+    Convert a YOLO labels folder into one keypoint store file per video.
+
+    Frames are ordered by their frame number, and every detected person is
+    kept, not only the first line of each file. Track IDs are stored when
+    the labels were written while tracking.
+
+    Returns:
+        list: Paths of the written store files
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+
+    for stem, (frame_rows, frame_track_ids, frame_index) in read_labels_folder(labels_dir).items():
+        rows = pack_frame_rows(frame_rows)
+        extra_arrays = {}
+        if any((ids != NO_TRACK).any() for ids in frame_track_ids):
+            extra_arrays['track_id'] = pack_frame_track_ids(frame_track_ids, rows.shape[1])
+
+        output_path = os.path.join(output_dir, stem + STORE_EXTENSION)
+        write_keypoint_store(
+            output_path,
+            rows,
+            frame_index,
+            metadata=dict(metadata or {}, source=os.path.abspath(labels_dir), video=stem),
+            **extra_arrays,
+        )
+        written.append(output_path)
+        print(f"Converted {len(frame_rows)} frames of {stem} -> {output_path}")
+
+    return written
+
+
+def convert_runs(runs_dir=os.path.join('runs', 'pose'), output_dir='keypoints'):
+    """
+    Convert every runs/pose/*/labels folder. Each store is named after the run
+    and video, e.g. keypoints/predict2/processed_video2.gkp.
+    """
+    written = []
+    for run in sorted(os.listdir(runs_dir)):
+        labels_dir = os.path.join(runs_dir, run, 'labels')
+        if os.path.isdir(labels_dir):
+            written.extend(convert_labels_folder(labels_dir, os.path.join(output_dir, run), {'run': run}))
+    return written
+
+
+if __name__ == "__main__":
+    convert_runs()
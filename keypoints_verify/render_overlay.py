@@ -0,0 +1,263 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keypoint_store import NO_TRACK, NUM_KEYPOINTS, is_keypoint_store, open_keypoint_store, pack_frame_rows, \
+    pack_frame_track_ids, read_labels_sequence
+
+# COCO-17 limb connections
+SKELETON = [(0, 1), (0, 2), (1, 3), (2, 4), (5, 6), (5, 7), (7, 9), (6, 8), (8, 10), (5, 11), (6, 12),
+            (11, 12), (11, 13), (13, 15), (12, 14), (14, 16)]
+# Left side, right side and centre limbs in BGR
+LEFT_COLOR, RIGHT_COLOR, CENTRE_COLOR = (255, 128, 0), (0, 128, 255), (0, 220, 0)
+TRACK_COLORS = [(255, 128, 0), (0, 128, 255), (0, 220, 0), (220, 0, 220), (0, 220, 220), (220, 220, 0)]
+BACKGROUND = 30
+
+
+def load_render_rows(path):
+    """
+    Every person of a labels folder or keypoint store, as used by the analysis.
+
+    Returns:
+        tuple: (frames, persons, 56) rows, (frames,) frame numbers and the
+            (frames, persons) track IDs or None
+    """
+    if is_keypoint_store(path):
+        store = open_keypoint_store(path)
+        return store.rows, store.frame_index, store.track_id
+
+    frame_rows, frame_track_ids, frame_index = read_labels_sequence(path)
+    rows = pack_frame_rows(frame_rows)
+    track_id = pack_frame_track_ids(frame_track_ids, rows.shape[1])
+    return rows, frame_index, track_id if (track_id != NO_TRACK).any() else None
+
+
+def _limb_color(a, b):
+    if a % 2 and b % 2:
+        return LEFT_COLOR
+    if a and b and a % 2 == 0 and b % 2 == 0:
+        return RIGHT_COLOR
+    return CENTRE_COLOR
+
+
+def draw_skeleton(canvas, keypoints, min_confidence=0.3, color=None, thickness=2):
+    """
+    Draw one person's (17, 3) normalised keypoints onto a BGR image in place.
+    Keypoints below min_confidence or at (0, 0) are left out.
+    """
+    height, width = canvas.shape[:2]
+    keypoints = np.asarray(keypoints, dtype=np.float64)
+    if np.isnan(keypoints).all():
+        return canvas
+    points = np.round(keypoints[:, :2] * (width, height)).astype(int)
+    visible = (keypoints[:, 2] >= min_confidence) & ~np.all(keypoints[:, :2] == 0, axis=1)
+
+    for a, b in SKELETON:
+        if visible[a] and visible[b]:
+            cv2.line(canvas, tuple(points[a]), tuple(points[b]), color or _limb_color(a, b), thickness,
+                     cv2.LINE_AA)
+    for point in points[visible]:
+        cv2.circle(canvas, tuple(point), thickness + 1, (255, 255, 255), -1, cv2.LINE_AA)
+    return canvas
+
+
+def draw_frame(canvas, frame_rows, track_ids=None, min_confidence=0.3, thickness=2):
+    """Draw every person of one frame's (persons, 56) rows, coloured by track if tracked"""
+    for person, row in enumerate(frame_rows):
+        if np.isnan(row[0]):
+            continue
+        color = None
+        if track_ids is not None and track_ids[person] != NO_TRACK:
+            color = TRACK_COLORS[track_ids[person] % len(TRACK_COLORS)]
+        draw_skeleton(canvas, row[5:].reshape(NUM_KEYPOINTS, 3), min_confidence, color, thickness)
+    return canvas
+
+
+def render_video(rows, output_path, frame_index=None, track_id=None, video_path=None, first_frame=1,
+                 size=(640, 360), fps=20, min_confidence=0.3):
+    """
+    Write a verification MP4 with the skeletons drawn onto the source video,
+    or onto a blank canvas when no video is given.
+
+    Args:
+        rows (np.ndarray): (frames, persons, 56) or (frames, 56) label rows
+        output_path (str): Output .mp4 file
+        frame_index (np.ndarray): Frame number of each row (defaults to positions)
+        track_id (np.ndarray): (frames, persons) track IDs to colour persons by
+        video_path (str): Video the keypoints were extracted from
+        first_frame (int): Frame number of the video's first frame (ultralytics
+            numbers label files from 1; stores from the pipeline start at 0)
+        size (tuple): Canvas (width, height) without a video
+        fps (float): Frame rate without a video
+
+    Returns:
+        int: Number of frames written
+    """
+    rows = np.asarray(rows)
+    if rows.ndim == 2:
+        rows = rows[:, None, :]
+    frame_index = np.arange(len(rows)) + first_frame if frame_index is None else np.asarray(frame_index)
+    by_frame = {int(frame): i for i, frame in enumerate(frame_index)}
+
+    cap = None
+    if video_path is not None:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"Error: Cannot open video file {video_path}")
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        fps = cap.get(cv2.CAP_PROP_FPS) or fps
+        frame_numbers = itertools.count(first_frame)
+    else:
+        frame_numbers = range(int(frame_index.min()), int(frame_index.max()) + 1) if len(frame_index) else []
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    thickness = max(2, size[0] // 400)
+    written = 0
+    try:
+        for frame_number in frame_numbers:
+            if cap is not None:
+                success, canvas = cap.read()
+                if not success:
+                    break
+            else:
+                canvas = np.full((size[1], size[0], 3), BACKGROUND, dtype=np.uint8)
+
+            i = by_frame.get(frame_number)
+            if i is not None:
+                draw_frame(canvas, rows[i], track_id[i] if track_id is not None else None, min_confidence,
+                           thickness)
+            cv2.putText(canvas, str(frame_number), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+            writer.write(canvas)
+            written += 1
+    finally:
+        writer.release()
+        if cap is not None:
+            cap.release()
+    return written
+
+
+def contact_sheet(rows, output_path, frame_index=None, track_id=None, columns=8, max_tiles=64,
+                  tile_size=(160, 240), min_confidence=0.3):
+    """
+    Write an image tiling evenly spaced frames of a sequence, each skeleton
+    drawn on its own blank tile, for a quick look at a whole sequence.
+
+    Returns:
+        np.ndarray: The contact sheet image
+    """
+    rows = np.asarray(rows)
+    if rows.ndim == 2:
+        rows = rows[:, None, :]
+    frame_index = np.arange(len(rows)) if frame_index is None else np.asarray(frame_index)
+    picks = np.unique(np.linspace(0, len(rows) - 1, min(max_tiles, len(rows))).astype(int))
+
+    width, height = tile_size
+    tiles_down = -(-len(picks) // columns)
+    sheet = np.full((tiles_down * height, columns * width, 3), BACKGROUND, dtype=np.uint8)
+    for n, i in enumerate(picks):
+        top, left = (n // columns) * height, (n % columns) * width
+        tile = sheet[top:top + height, left:left + width]
+        draw_frame(tile, rows[i], track_id[i] if track_id is not None else None, min_confidence, thickness=1)
+        cv2.rectangle(tile, (0, 0), (width - 1, height - 1), (80, 80, 80), 1)
+        cv2.putText(tile, str(int(frame_index[i])), (4, 14), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    cv2.imwrite(output_path, sheet)
+    return sheet
+
+
+def _output_name(path):
+    path = os.path.normpath(path)
+    if os.path.basename(path) == 'labels':
+        path = os.path.dirname(path)
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def render_sequence(path, output_dir, video_path=None, first_frame=1, video=True, sheet=True):
+    """
+    Render the verification MP4 and/or contact sheet of one labels folder or
+    keypoint store
+
+    Returns:
+        list: Paths of the written files
+    """
+    rows, frame_index, track_id = load_render_rows(path)
+    name = _output_name(path)
+    written = []
+    if video:
+        output_path = os.path.join(output_dir, name + '.mp4')
+        render_video(rows, output_path, frame_index, track_id, video_path=video_path, first_frame=first_frame)
+        written.append(output_path)
+    if sheet:
+        output_path = os.path.join(output_dir, name + '_sheet.png')
+        contact_sheet(rows, output_path, frame_index, track_id)
+        written.append(output_path)
+    return written
+
+
+def _render_worker(args):
+    path, output_dir, video_path, first_frame, video, sheet = args
+    return render_sequence(path, output_dir, video_path, first_frame, video, sheet)
+
+
+def render_sequences(paths, output_dir, video_paths=None, first_frame=1, video=True, sheet=True, workers=None):
+    """
+    Render many sequences in parallel worker processes.
+
+    Args:
+        paths (list): Labels folders or keypoint stores
+        output_dir (str): Directory for the MP4s and contact sheets
+        video_paths (list): Source video per sequence to draw onto, or None for blank canvases
+        workers (int): Number of worker processes (defaults to the CPU count)
+
+    Returns:
+        list: Paths of the written files
+    """
+    video_paths = video_paths or [None] * len(paths)
+    jobs = [(path, output_dir, video_path, first_frame, video, sheet) for path, video_path in zip(paths, video_paths)]
+    written = []
+    failures = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(_render_worker, job): job[0] for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                written.extend(future.result())
+                print(f"[{done}/{len(jobs)}] Rendered {path}")
+            except Exception as e:
+                failures.append(f"{path}: {e}")
+                print(f"[{done}/{len(jobs)}] Failed {path}: {e}")
+
+    print(f"Rendered {len(jobs) - len(failures)} sequences in {time.perf_counter() - start:.2f}s")
+    if failures:
+        raise ValueError("Error: Some sequences failed to render:\n" + "\n".join(failures))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render keypoint overlays and contact sheets with OpenCV")
+    parser.add_argument('paths', nargs='+', help="Labels folders or keypoint stores")
+    parser.add_argument('--output-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                             'visualizations'))
+    parser.add_argument('--videos', nargs='+', help="Source video per sequence to draw onto")
+    parser.add_argument('--first-frame', type=int, default=1,
+                        help="Frame number of each video's first frame (0 for pipeline stores)")
+    parser.add_argument('--no-video', action='store_true', help="Only write contact sheets")
+    parser.add_argument('--no-sheet', action='store_true', help="Only write MP4s")
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    if args.videos and len(args.videos) != len(args.paths):
+        parser.error("--videos needs one video per sequence")
+    render_sequences(args.paths, args.output_dir, args.videos, args.first_frame, video=not args.no_video,
+                     sheet=not args.no_sheet, workers=args.workers)
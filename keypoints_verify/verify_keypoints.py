@@ -1,20 +1,14 @@
-import numpy as np
-import matplotlib.pyplot as plt
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from keypoint_store import first_person_sequence, is_keypoint_store, open_keypoint_store
 
 def load_keypoints(folder_path):
-    """Load keypoint files from folder"""
-    all_frames = []
-    files = [f for f in os.listdir(folder_path) if f.endswith('.txt')]
-    files.sort()
-#made a small change
-    for file in files:
-        with open(os.path.join(folder_path, file), 'r') as f:
-            data = f.readline().strip().split()
-            frame_data = [float(x) for x in data]
-            all_frames.append(frame_data)
-    
-    return np.array(all_frames)
+    """Load keypoint files from folder, or memory-map a packed keypoint store"""
+    if is_keypoint_store(folder_path):
+        return open_keypoint_store(folder_path).first_person_rows()
+    return first_person_sequence(folder_path)
 
 def extract_coordinates(keypoints):
     """Extract equal numbers of x and y coordinates"""
@@ -30,6 +24,8 @@ def extract_coordinates(keypoints):
 
 def visualize_frame(frame_data, frame_num, save_path=None):
     """Visualize keypoints for a single frame"""
+    import matplotlib.pyplot as plt
+
     keypoints = frame_data[7:]  # Skip first 7 values
     x_coords, y_coords, num_points = extract_coordinates(keypoints)
     
@@ -65,8 +61,10 @@ def visualize_frame(frame_data, frame_num, save_path=None):
     else:
         plt.show()
 
-def visualize_sequence(sequence_data, start_frame=0, num_frames=5):
+def visualize_sequence(sequence_data, start_frame=0, num_frames=5, save_path=None):
     """Visualize multiple frames in sequence"""
+    import matplotlib.pyplot as plt
+
     num_frames = min(num_frames, len(sequence_data) - start_frame)
     fig, axes = plt.subplots(1, num_frames, figsize=(20, 4))
     fig.suptitle('Keypoint Sequence Verification')
@@ -95,7 +93,11 @@ def visualize_sequence(sequence_data, start_frame=0, num_frames=5):
         axes[i].set_aspect('equal')
     
     plt.tight_layout()
-    plt.show()
+    if save_path:
+        plt.savefig(save_path)
+        plt.close()
+    else:
+        plt.show()
 
 def analyze_keypoint_data(sequence_data):
     """Analyze keypoint data for basic statistics and anomalies"""
@@ -144,13 +146,14 @@ def verify_keypoints(folder_path, output_folder=None):
     
     # Visualize sequence
     print("\nGenerating sequence visualization...")
-    visualize_sequence(sequence_data, start_frame=0, num_frames=5)
+    save_path = os.path.join(output_folder, 'sequence.png') if output_folder else None
+    visualize_sequence(sequence_data, start_frame=0, num_frames=5, save_path=save_path)
     
     return sequence_data
 
 if __name__ == "__main__":
-    folder_path = r"C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\runs\pose\predict2\labels"
-    output_folder = r"C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\keypoints_verify\visualizations"
+    folder_path = os.path.join('runs', 'pose', 'predict2', 'labels')
+    output_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'visualizations')
     
     if output_folder and not os.path.exists(output_folder):
         os.makedirs(output_folder)
@@ -0,0 +1,275 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from instrumentation import metrics
+from keypoint_store import NO_TRACK, STORE_EXTENSION, pack_frame_rows, pack_frame_track_ids, write_keypoint_store
+
+DEFAULT_CHUNK_SECONDS = 60
+DEFAULT_OVERLAP_SECONDS = 2
+# Largest mean box-centre distance (normalised) for two tracks to be the same person
+MAX_MATCH_DISTANCE = 0.05
+
+# Pose model of a worker process, loaded once and reused for every chunk
+_worker_model = None
+
+
+def plan_chunks(frame_count, source_fps, chunk_seconds=DEFAULT_CHUNK_SECONDS,
+                overlap_seconds=DEFAULT_OVERLAP_SECONDS):
+    """
+    Split a video into (start, end) source frame ranges, end exclusive, each
+    chunk_seconds long and overlapping the next by overlap_seconds
+    """
+    chunk = max(1, int(round(chunk_seconds * source_fps)))
+    overlap = min(int(round(overlap_seconds * source_fps)), chunk - 1)
+    chunks = []
+    start = 0
+    while start < frame_count:
+        end = min(frame_count, start + chunk)
+        chunks.append((start, end))
+        if end == frame_count:
+            break
+        start = end - overlap
+    return chunks
+
+
+def _init_worker(model_path):
+    global _worker_model
+    from pose import load_pose_model
+    _worker_model = load_pose_model(model_path)
+
+
+def _reset_trackers(model):
+    """
+    Start a chunk with empty tracks and IDs counting from 1 again. ultralytics
+    keeps its trackers on the predictor across track(persist=True) calls, so
+    a worker's model would otherwise carry tracks over from its last chunk.
+    """
+    predictor = getattr(model, 'predictor', None)
+    for tracker in getattr(predictor, 'trackers', None) or []:
+        tracker.reset()
+
+
+def process_chunk(video_path, start, end, step, model=None, tracker="bytetrack.yaml"):
+    """
+    Decode one chunk and run tracked pose inference on every step-th source
+    frame (counted from the start of the video, so overlapping chunks sample
+    the same frames).
+
+    Returns:
+        tuple: (frames,) source frame numbers, and per frame the
+            (n_persons, 56) rows and (n_persons,) chunk-local track IDs
+    """
+    from pose import result_to_rows, result_track_ids
+
+    model = model or _worker_model
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video file {video_path}")
+
+    _reset_trackers(model)
+    frame_numbers, frame_rows, frame_track_ids = [], [], []
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for frame_number in range(start, end):
+            if frame_number % step:
+                if not cap.grab():
+                    break
+                continue
+            success, frame = cap.read()
+            if not success:
+                break
+            result = model.track(frame, persist=True, tracker=tracker, device="cpu", verbose=False)[0]
+            frame_numbers.append(frame_number)
+            frame_rows.append(result_to_rows(result))
+            frame_track_ids.append(result_track_ids(result))
+    finally:
+        cap.release()
+    return np.array(frame_numbers, dtype=np.int64), frame_rows, frame_track_ids
+
+
+def _process_chunk_worker(args):
+    return process_chunk(*args)
+
+
+def _track_centres(frame_rows, frame_track_ids, positions):
+    """Box centre of every track at the given frame positions, NaN where absent"""
+    centres = {}
+    for n, i in enumerate(positions):
+        for row, track_id in zip(frame_rows[i], frame_track_ids[i]):
+            if track_id != NO_TRACK:
+                centres.setdefault(int(track_id), np.full((len(positions), 2), np.nan))[n] = row[1:3]
+    return centres
+
+
+def match_tracks(previous, current, max_distance=MAX_MATCH_DISTANCE):
+    """
+    Pair the tracks of two chunks over their shared frames by the mean
+    distance between box centres, with an optimal (Hungarian) assignment.
+
+    Args:
+        previous, current (dict): Track ID -> (overlap frames, 2) centres, NaN where absent
+
+    Returns:
+        dict: Current track ID -> matched previous track ID
+    """
+    if not previous or not current:
+        return {}
+    previous_ids, current_ids = list(previous), list(current)
+    a = np.stack([previous[i] for i in previous_ids])[:, None]
+    b = np.stack([current[i] for i in current_ids])[None, :]
+    distances = np.linalg.norm(a - b, axis=3)
+    shared = ~np.isnan(distances)
+    with np.errstate(invalid='ignore'):
+        cost = np.where(shared.any(axis=2), np.nansum(distances, axis=2) / np.maximum(shared.sum(axis=2), 1),
+                        np.inf)
+
+    rows, cols = linear_sum_assignment(np.where(np.isfinite(cost), cost, 1e6))
+    return {current_ids[c]: previous_ids[r] for r, c in zip(rows, cols) if cost[r, c] <= max_distance}
+
+
+def merge_chunks(chunks, max_distance=MAX_MATCH_DISTANCE):
+    """
+    Merge per-chunk results into one timeline.
+
+    Overlapping frames are taken from the earlier chunk up to the middle of
+    the overlap and from the later chunk after it, so no frame appears twice
+    and each tracker is used away from its cold start. Track IDs are made
+    unique across chunks, and tracks seen in both chunks of an overlap keep
+    the earlier chunk's ID.
+
+    Args:
+        chunks (list): process_chunk results in time order
+
+    Returns:
+        tuple: (frames,) frame numbers, per-frame rows and per-frame global track IDs
+    """
+    frame_numbers, frame_rows, frame_track_ids = [], [], []
+    next_id = 0
+    previous = None
+
+    for numbers, rows, track_ids in chunks:
+        mapping = {}
+        if previous is not None:
+            prev_numbers, prev_rows, prev_ids, prev_mapping = previous
+            shared = np.intersect1d(prev_numbers, numbers)
+            prev_positions = np.searchsorted(prev_numbers, shared)
+            positions = np.searchsorted(numbers, shared)
+            prev_centres = _track_centres(prev_rows, prev_ids, prev_positions)
+            matched = match_tracks({prev_mapping[i]: c for i, c in prev_centres.items()},
+                                   _track_centres(rows, track_ids, positions), max_distance)
+            mapping.update(matched)
+            metrics.increment('chunk_tracks_joined', len(matched))
+
+            # Drop the previous chunk's frames past the middle of the overlap
+            cut = shared[len(shared) // 2] if len(shared) else numbers[0] if len(numbers) else None
+            while frame_numbers and cut is not None and frame_numbers[-1] >= cut:
+                frame_numbers.pop()
+                frame_rows.pop()
+                frame_track_ids.pop()
+            keep = numbers >= cut if cut is not None else np.ones(len(numbers), dtype=bool)
+        else:
+            keep = np.ones(len(numbers), dtype=bool)
+
+        for track_id in np.unique(np.concatenate(track_ids)) if track_ids else []:
+            if track_id != NO_TRACK and int(track_id) not in mapping:
+                mapping[int(track_id)] = next_id
+                next_id += 1
+        # Fresh IDs never collide with joined ones
+        next_id = max([next_id] + [value + 1 for value in mapping.values()])
+
+        for i in np.flatnonzero(keep):
+            frame_numbers.append(int(numbers[i]))
+            frame_rows.append(rows[i])
+            frame_track_ids.append(np.array([mapping.get(int(t), NO_TRACK) for t in track_ids[i]], dtype=np.int32))
+        previous = (numbers, rows, track_ids, mapping)
+
+    return np.array(frame_numbers, dtype=np.int64), frame_rows, frame_track_ids
+
+
+def process_long_footage(video_path, output_path=None, model_path="yolov8n-pose.pt", target_fps=20,
+                         chunk_seconds=DEFAULT_CHUNK_SECONDS, overlap_seconds=DEFAULT_OVERLAP_SECONDS,
+                         workers=None, tracker="bytetrack.yaml"):
+    """
+    Track every person through a long recording in parallel chunks and write
+    the merged timeline as one keypoint store with track IDs.
+
+    The whole recording is analysed at target_fps (nothing is trimmed), and
+    the store's frame_index holds source frame numbers, so frame / fps gives
+    the time into the recording. The result works with tracking.score_tracks.
+
+    Args:
+        video_path (str): Source recording
+        output_path (str): Output .gkp file (defaults next to the video)
+        model_path (str): Pose model weights, loaded once per worker
+        target_fps (int): Analysis frame rate
+        chunk_seconds (float): Length of each chunk
+        overlap_seconds (float): Overlap between consecutive chunks
+        workers (int): Worker processes (defaults to the CPU count)
+        tracker (str): ultralytics tracker config
+
+    Returns:
+        str: Path of the written store
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video file {video_path}")
+    source_fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if not source_fps:
+        raise ValueError(f"Error: Video file {video_path} has an invalid FPS value.")
+
+    step = max(1, int(round(source_fps / target_fps)))
+    chunks = plan_chunks(frame_count, source_fps, chunk_seconds, overlap_seconds)
+    print(f"{video_path}: {frame_count} frames at {source_fps:.2f} fps in {len(chunks)} chunks")
+
+    start = time.perf_counter()
+    results = [None] * len(chunks)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path,)) as executor:
+        futures = {executor.submit(_process_chunk_worker, (video_path, chunk_start, chunk_end, step, None, tracker)): i
+                   for i, (chunk_start, chunk_end) in enumerate(chunks)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            results[i] = future.result()
+            print(f"[{done}/{len(chunks)}] Chunk {i} (frames {chunks[i][0]}-{chunks[i][1] - 1}) processed")
+
+    frame_numbers, frame_rows, frame_track_ids = merge_chunks(results)
+    elapsed = time.perf_counter() - start
+    metrics.observe('long_footage', elapsed)
+    metrics.increment('frames_inferred', sum(len(result[0]) for result in results))
+
+    rows = pack_frame_rows(frame_rows)
+    output_path = output_path or os.path.splitext(video_path)[0] + STORE_EXTENSION
+    write_keypoint_store(
+        output_path,
+        rows,
+        frame_numbers,
+        metadata={'video': os.path.abspath(video_path), 'model': model_path, 'tracker': tracker,
+                  'source_fps': source_fps, 'target_fps': target_fps},
+        track_id=pack_frame_track_ids(frame_track_ids, rows.shape[1]),
+    )
+    tracks = len({int(t) for ids in frame_track_ids for t in ids if t != NO_TRACK})
+    print(f"Merged {len(frame_numbers)} frames, {tracks} tracks in {elapsed:.2f}s "
+          f"({len(frame_numbers) / elapsed:.1f} frames/s) -> {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Track people through long footage in parallel chunks")
+    parser.add_argument('video')
+    parser.add_argument('--output')
+    parser.add_argument('--model', default='yolov8n-pose.pt')
+    parser.add_argument('--target-fps', type=int, default=20)
+    parser.add_argument('--chunk-seconds', type=float, default=DEFAULT_CHUNK_SECONDS)
+    parser.add_argument('--overlap-seconds', type=float, default=DEFAULT_OVERLAP_SECONDS)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    process_long_footage(args.video, args.output, args.model, args.target_fps, args.chunk_seconds,
+                         args.overlap_seconds, args.workers)
@@ -0,0 +1,142 @@
+import cv2
+import numpy as np
+
+from keypoint_store import NUM_KEYPOINTS, ROW_LENGTH
+
+# Width frames are downscaled to before motion detection
+GATE_WIDTH = 160
+
+
+class MotionGate:
+    """
+    Cheap per-frame decision whether pose inference is worth running.
+
+    Frames are downscaled and converted to grayscale, then compared with the
+    previous frame (method='diff') or with a MOG2 background model
+    (method='mog2'). A frame has motion when the fraction of changed pixels
+    reaches min_motion. Without motion only every idle_stride-th frame is
+    inferred, and max_gap bounds the number of consecutive skipped frames so
+    interpolation never has to bridge long gaps. With both None, static
+    stretches are skipped entirely.
+    """
+
+    def __init__(self, method='diff', pixel_threshold=25, min_motion=0.002, idle_stride=None, max_gap=10):
+        """
+        Args:
+            method (str): 'diff' for frame differencing, 'mog2' for background subtraction
+            pixel_threshold (int): Grey level change counted as motion (diff only)
+            min_motion (float): Fraction of changed pixels that counts as motion
+            idle_stride (int): Infer every idle_stride-th frame without motion
+            max_gap (int): Most consecutive frames skipped before one is inferred anyway
+                (None for no limit)
+        """
+        if method not in ('diff', 'mog2'):
+            raise ValueError(f"Error: Unknown motion gate method {method}")
+        self.method = method
+        self.pixel_threshold = pixel_threshold
+        self.min_motion = min_motion
+        self.idle_stride = idle_stride
+        self.max_gap = max_gap
+
+        self._previous = None
+        self._subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False) if method == 'mog2' else None
+        self._gap = 0
+        self._idle = 0
+        self.frames = 0
+        self.skipped = 0
+
+    def motion(self, frame):
+        """Fraction of pixels that changed in this frame"""
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (GATE_WIDTH, max(1, height * GATE_WIDTH // width)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+        if self._subtractor is not None:
+            mask = self._subtractor.apply(gray)
+        else:
+            if self._previous is None:
+                self._previous = gray
+                return 1.0
+            mask = cv2.threshold(cv2.absdiff(gray, self._previous), self.pixel_threshold, 255,
+                                 cv2.THRESH_BINARY)[1]
+            self._previous = gray
+        return cv2.countNonZero(mask) / mask.size
+
+    def should_infer(self, frame):
+        """Decide whether to run pose inference on the next frame of the video"""
+        moving = self.motion(frame) >= self.min_motion
+        if moving:
+            self._idle = 0
+        else:
+            self._idle += 1
+
+        infer = (self.frames == 0 or moving
+                 or (self.max_gap is not None and self._gap >= self.max_gap)
+                 or (self.idle_stride is not None and self._idle % self.idle_stride == 0))
+        self.frames += 1
+        if infer:
+            self._gap = 0
+        else:
+            self._gap += 1
+            self.skipped += 1
+        return infer
+
+    @property
+    def skipped_fraction(self):
+        return self.skipped / self.frames if self.frames else 0.0
+
+
+def interpolate_skipped_rows(frame_rows):
+    """
+    Fill frames that were not inferred (None) with keypoint rows linearly
+    interpolated between the nearest inferred frames on either side.
+
+    Only the first person is interpolated, which is the one the gait features
+    use. A gap is filled only when the inferred frames on both sides have a
+    detection; otherwise its frames are left without one, like frames where
+    the model found nobody.
+
+    Args:
+        frame_rows (list): Per-frame (n_persons, 56) arrays, None where skipped
+
+    Returns:
+        list: The same frames, skipped ones replaced by (1, 56) or (0, 56) arrays
+    """
+    n = len(frame_rows)
+    inferred = np.array([rows is not None for rows in frame_rows])
+    if inferred.all():
+        return list(frame_rows)
+
+    first = np.full((n, ROW_LENGTH), np.nan)
+    detected = np.zeros(n, dtype=bool)
+    for i, rows in enumerate(frame_rows):
+        if rows is not None and len(rows):
+            first[i] = rows[0, :ROW_LENGTH]
+            detected[i] = True
+
+    # Nearest inferred frame before and after every frame
+    positions = np.arange(n)
+    previous = np.maximum.accumulate(np.where(inferred, positions, -1))
+    following = np.minimum.accumulate(np.where(inferred, positions, n)[::-1])[::-1]
+
+    fill = ~inferred & (previous >= 0) & (following < n)
+    fill[fill] = detected[previous[fill]] & detected[following[fill]]
+    weight = ((positions[fill] - previous[fill]) / (following[fill] - previous[fill]))[:, None]
+    interpolated = first[previous[fill]] * (1 - weight) + first[following[fill]] * weight
+
+    # A keypoint undetected (0, 0) at either end stays undetected in between
+    keypoints = interpolated[:, 5:].reshape(len(interpolated), NUM_KEYPOINTS, 3)
+    undetected = np.zeros(keypoints.shape[:2], dtype=bool)
+    for end in (previous[fill], following[fill]):
+        end_xy = first[end, 5:].reshape(len(end), NUM_KEYPOINTS, 3)[..., :2]
+        undetected |= np.all(end_xy == 0, axis=2)
+    keypoints[undetected] = 0
+
+    filled = list(frame_rows)
+    empty = np.empty((0, ROW_LENGTH), dtype=np.float32)
+    for i in np.flatnonzero(~inferred):
+        filled[i] = empty
+    for i, row in zip(np.flatnonzero(fill), interpolated):
+        filled[i] = row[None, :].astype(np.float32)
+    return filled
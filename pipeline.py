@@ -0,0 +1,289 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from gait_similarity import (compare_sequences, compute_gait_features, sequence_to_keypoints,
+                             summarize_gait_features)
+from instrumentation import metrics
+from keypoint_store import pack_frame_rows
+from motion_gate import MotionGate, interpolate_skipped_rows
+from pose import load_pose_model, result_to_rows
+from resample import decode_timed_frames, resample_rows
+from roi import RoiPoseRunner
+
+# Marks the end of one video (or of the whole run) in the stage queues
+_END_OF_VIDEO = "end_of_video"
+_END_OF_RUN = "end_of_run"
+
+
+def decode_frames(video_path, target_fps=20, target_duration=6):
+    """
+    Yield (frame_index, frame) pairs from a video, decimated to target_fps and
+    capped at target_fps * target_duration frames, matching preprocess_videos.
+    Dropped frames are grabbed but never decoded.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video file {video_path}")
+
+    try:
+        source_fps = int(cap.get(cv2.CAP_PROP_FPS))
+        if source_fps == 0:
+            raise ValueError(f"Error: Video file {video_path} has an invalid FPS value.")
+
+        step = max(1, int(source_fps / target_fps))
+        target_frame_count = target_fps * target_duration
+        kept = 0
+        count = 0
+
+        while kept < target_frame_count:
+            if not cap.grab():
+                break
+            if count % step == 0:
+                success, frame = cap.retrieve()
+                if not success:
+                    break
+                yield kept, frame
+                kept += 1
+            count += 1
+    finally:
+        cap.release()
+
+
+def _put(q, item, stop):
+    """Put into a bounded queue without blocking forever once the run is stopped"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _decode_stage(video_paths, frame_queue, stop, target_fps, target_duration, motion_gate, timestamps):
+    try:
+        for video_idx, video_path in enumerate(video_paths):
+            decoded = 0
+            gate = MotionGate(**motion_gate) if motion_gate is not None else None
+            if timestamps is not None:
+                frames = decode_timed_frames(video_path, target_duration)
+            else:
+                frames = ((frame_idx, None, frame) for frame_idx, frame in
+                          decode_frames(video_path, target_fps, target_duration))
+            for frame_idx, timestamp, frame in frames:
+                if timestamps is not None:
+                    # Read by the main thread once the video's end marker arrives
+                    timestamps.setdefault(video_idx, []).append(timestamp)
+                if gate is not None and not gate.should_infer(frame):
+                    # Skipped frames travel without pixels so their order is kept
+                    frame = None
+                if not _put(frame_queue, (video_idx, frame_idx, frame), stop):
+                    return
+                decoded += 1
+            metrics.increment('frames_decoded', decoded)
+            if gate is not None:
+                metrics.increment('frames_skipped', gate.skipped, reason='no_motion')
+                print(f"{video_path}: motion gate skipped {gate.skipped} of {gate.frames} frames "
+                      f"({gate.skipped_fraction * 100:.1f}%)")
+            if not _put(frame_queue, (video_idx, _END_OF_VIDEO, None), stop):
+                return
+        _put(frame_queue, (None, _END_OF_RUN, None), stop)
+    except Exception as e:
+        _put(frame_queue, (None, e, None), stop)
+
+
+def _inference_stage(model, frame_queue, result_queue, stop, batch_size, roi):
+    batch = []
+    # Crops depend on the previous frame's box, so ROI mode infers frame by frame
+    runner = RoiPoseRunner(model, **roi) if roi is not None else None
+
+    def flush():
+        if not batch:
+            return True
+        frames = [frame for _, _, frame in batch if frame is not None]
+        results = []
+        if frames:
+            with metrics.timer('inference'):
+                results = iter(model(frames, verbose=False))
+            metrics.increment('frames_inferred', len(frames))
+        for video_idx, frame_idx, frame in batch:
+            # Frames skipped by the motion gate get None instead of rows
+            rows = result_to_rows(next(results)) if frame is not None else None
+            if not _put(result_queue, (video_idx, frame_idx, rows), stop):
+                return False
+        batch.clear()
+        return True
+
+    try:
+        while not stop.is_set():
+            try:
+                video_idx, frame_idx, frame = frame_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if isinstance(frame_idx, (str, Exception)):
+                # Control message: drain the pending batch, then forward it
+                if not flush():
+                    return
+                _put(result_queue, (video_idx, frame_idx, None), stop)
+                if runner is not None:
+                    runner.reset()
+                if frame_idx is _END_OF_RUN or isinstance(frame_idx, Exception):
+                    return
+                continue
+
+            if runner is not None:
+                rows = None
+                if frame is not None:
+                    with metrics.timer('inference'):
+                        rows = runner.infer(frame)
+                    metrics.increment('frames_inferred')
+                if not _put(result_queue, (video_idx, frame_idx, rows), stop):
+                    return
+                continue
+
+            batch.append((video_idx, frame_idx, frame))
+            if len(batch) >= batch_size and not flush():
+                return
+    except Exception as e:
+        _put(result_queue, (None, e, None), stop)
+
+
+def frames_to_sequence(frame_rows, target_frame_count):
+    """
+    Build the (frames, 56) sequence array from per-frame detections.
+    Short clips are looped like preprocess_videos does, and frames without a
+    detection are dropped like missing label files are.
+    """
+    frame_rows = list(frame_rows)
+    if not frame_rows:
+        raise ValueError("No frames decoded")
+
+    while len(frame_rows) < target_frame_count:
+        frame_rows.extend(frame_rows[:target_frame_count - len(frame_rows)])
+
+    sequence = [rows[0] for rows in frame_rows[:target_frame_count] if len(rows)]
+    if not sequence:
+        raise ValueError("No person detected in any frame")
+    return np.stack(sequence)
+
+
+def run_pipeline(video_paths, model=None, model_path="yolov8n-pose.pt", target_fps=20,
+                 target_duration=6, batch_size=8, queue_size=32, motion_gate=None, roi=None, resample=False):
+    """
+    Decode, run pose inference and compute gait features for several videos
+    without writing any intermediate files.
+
+    Decoding and inference run in their own threads connected by bounded
+    queues, and feature calculation for a finished video runs on the calling
+    thread while the next video is still being decoded and inferred.
+
+    Args:
+        video_paths (list): Paths to input videos
+        model: Loaded YOLO pose model (loaded from model_path if None)
+        model_path (str): Pose model weights
+        target_fps (int): Frames per second to sample from each video
+        target_duration (int): Duration in seconds to keep from each video
+        batch_size (int): Frames per inference call
+        queue_size (int): Maximum number of frames/results buffered between stages
+        motion_gate (dict): MotionGate options to skip inference on frames
+            without motion and interpolate their keypoints ({} for defaults,
+            None to infer every frame)
+        roi (dict): RoiPoseRunner options to infer on a crop around the
+            subject instead of the full frame ({} for defaults, None for
+            full-frame inference)
+        resample (bool): Infer every frame at the video's native frame rate
+            and resample the keypoints to target_fps by their timestamps,
+            instead of decimating frames by an integer step and looping
+            short clips
+
+    Returns:
+        list: One dict per video with 'sequence' (frames, 56), 'features'
+            (valid frames, 4) and the per-frame 'valid' mask
+    """
+    if model is None:
+        model = load_pose_model(model_path)
+
+    target_frame_count = target_fps * target_duration
+    frame_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    timestamps = {} if resample else None
+
+    decoder = threading.Thread(
+        target=_decode_stage,
+        args=(video_paths, frame_queue, stop, target_fps, target_duration, motion_gate, timestamps),
+        daemon=True,
+    )
+    inferer = threading.Thread(
+        target=_inference_stage,
+        args=(model, frame_queue, result_queue, stop, batch_size, roi),
+        daemon=True,
+    )
+
+    start = time.perf_counter()
+    decoder.start()
+    inferer.start()
+
+    outputs = [None] * len(video_paths)
+    pending = {}
+    try:
+        while True:
+            video_idx, frame_idx, rows = result_queue.get()
+            if isinstance(frame_idx, Exception):
+                raise frame_idx
+            if frame_idx is _END_OF_RUN:
+                break
+            if frame_idx is _END_OF_VIDEO:
+                frame_rows = interpolate_skipped_rows(pending.pop(video_idx, []))
+                print(f"\nCalculating gait features for {video_paths[video_idx]}...")
+                metrics.increment('frames_rejected', sum(1 for rows in frame_rows if not len(rows)),
+                                  reason='no_detection')
+                if resample:
+                    sequence, _ = resample_rows(pack_frame_rows(frame_rows)[:, 0], timestamps.pop(video_idx),
+                                                target_fps, target_duration)
+                    # Frames without a detection are dropped like in frames_to_sequence
+                    sequence = sequence[~np.isnan(sequence[:, 0])]
+                    if not len(sequence):
+                        raise ValueError("No person detected in any frame")
+                else:
+                    sequence = frames_to_sequence(frame_rows, target_frame_count)
+                features, valid = compute_gait_features(sequence_to_keypoints(sequence))
+                summarize_gait_features(features, valid)
+                if not valid.any():
+                    raise ValueError(f"No valid frames in {video_paths[video_idx]}")
+                outputs[video_idx] = {'sequence': sequence, 'features': features[valid], 'valid': valid}
+                continue
+            pending.setdefault(video_idx, []).append(rows)
+    finally:
+        stop.set()
+        decoder.join()
+        inferer.join()
+
+    metrics.observe('pipeline', time.perf_counter() - start)
+    print(f"\nPipeline finished {len(video_paths)} videos in {time.perf_counter() - start:.2f}s")
+    return outputs
+
+
+def compare_videos(video1, video2, **kwargs):
+    """
+    Compare the gait in two videos end to end, in memory
+    """
+    outputs = run_pipeline([video1, video2], **kwargs)
+    return compare_sequences(outputs[0]['features'], outputs[1]['features'])
+
+
+if __name__ == "__main__":
+    video1 = os.path.join('videos', 'person1-a.mp4')
+    video2 = os.path.join('videos', 'person1-b.mp4')
+
+    similarity_score, detailed_metrics = compare_videos(video1, video2)
+    print(f"\nOverall Similarity Score: {similarity_score:.2f}%")
+    print("\nDetailed Metrics (higher is more similar):")
+    for feature, score in detailed_metrics.items():
+        print(f"{feature}: {score:.2f}%")
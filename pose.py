@@ -1,17 +1,272 @@
-from ultralytics import YOLO
+import os
+import time
 
-# Load YOLOv8 model
-model = YOLO("yolov8n-pose.pt")  # Load pretrained pose model
+import numpy as np
 
-# Specify the path to the video file
-video1 = r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\processed_videos\processed_video1.mp4'
-video2 = r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\processed_videos\processed_video2.mp4'
-video3= r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\processed_videos\processed_video3.mp4'
-video4= r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\processed_videos\processed_video4.mp4'
+from instrumentation import metrics
+from keypoint_store import NO_TRACK, STORE_EXTENSION, pack_frame_rows, pack_frame_track_ids, write_keypoint_store
 
-results = model(video1, save=True, save_txt=True)
-results = model(video2, save= True ,save_txt=True)
-results = model(video3, save = True, save_txt= True)
-results = model(video4, save = True, save_txt= True)
 
-print("Keypoint extraction completed.")
+def export_pose_model(model_path, export_format, imgsz=640):
+    """
+    Export the pose model to ONNX or OpenVINO for faster CPU inference.
+    The export is reused if it already exists next to the weights. Needs
+    onnx and onnxruntime, or openvino, which are not in requirements.txt.
+
+    Returns:
+        str: Path to the exported model
+    """
+    stem, _ = os.path.splitext(model_path)
+    if export_format == "onnx":
+        exported = stem + ".onnx"
+    elif export_format == "openvino":
+        exported = stem + "_openvino_model"
+    else:
+        raise ValueError(f"Error: Unsupported export format {export_format}")
+
+    if not os.path.exists(exported):
+        from ultralytics import YOLO
+        # Dynamic input shapes so the exported model accepts any batch size
+        exported = YOLO(model_path).export(format=export_format, imgsz=imgsz, dynamic=True)
+    return exported
+
+
+def load_pose_model(model_path="yolov8n-pose.pt", export_format=None, threads=None, imgsz=640):
+    """
+    Load the YOLO pose model, optionally switching to an exported ONNX or
+    OpenVINO model, and limit the number of intra-op CPU threads.
+
+    ultralytics is imported here so that importing this module stays cheap.
+
+    Args:
+        model_path (str): PyTorch pose weights
+        export_format (str): None for plain PyTorch, 'onnx' or 'openvino'
+        threads (int): Intra-op threads for inference (None keeps the default)
+        imgsz (int): Inference image size used for the export
+    """
+    if threads:
+        # Must be set before torch/onnxruntime create their thread pools
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+
+    from ultralytics import YOLO
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    if export_format:
+        model_path = export_pose_model(model_path, export_format, imgsz)
+
+    model = YOLO(model_path, task="pose")
+    model.inference_threads = threads
+    model.exported_path = model_path if export_format else None
+    return model
+
+
+def _tune_backend_threads(model, threads):
+    """
+    Rebuild an exported model's runtime session with a fixed intra-op thread
+    count. ultralytics creates these sessions with default options, so this
+    runs once the predictor exists.
+    """
+    exported = getattr(model, "exported_path", None)
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    if not threads or not exported or backend is None or getattr(backend, "threads_tuned", False):
+        return
+
+    if getattr(backend, "onnx", False):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        backend.session = onnxruntime.InferenceSession(
+            exported, sess_options=options, providers=backend.session.get_providers()
+        )
+    elif getattr(backend, "xml", False):
+        import glob
+        import openvino as ov
+        core = ov.Core()
+        xml = glob.glob(os.path.join(exported, "*.xml"))[0]
+        backend.ov_compiled_model = core.compile_model(
+            core.read_model(xml), device_name="CPU",
+            config={"INFERENCE_NUM_THREADS": threads, "PERFORMANCE_HINT": "THROUGHPUT"},
+        )
+    backend.threads_tuned = True
+
+
+def result_to_rows(result):
+    """
+    Convert one ultralytics pose result into label rows laid out exactly like
+    the save_txt files: class, normalised xywh box, then 17 x (x, y, conf).
+    Returns an (n_persons, 56) float32 array.
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0 or result.keypoints is None:
+        return np.empty((0, 56), dtype=np.float32)
+
+    cls = boxes.cls.cpu().numpy().reshape(-1, 1)
+    xywhn = boxes.xywhn.cpu().numpy()
+    kpts = result.keypoints.xyn.cpu().numpy()
+    if result.keypoints.conf is not None:
+        conf = result.keypoints.conf.cpu().numpy()[..., None]
+    else:
+        conf = np.ones(kpts.shape[:2] + (1,), dtype=kpts.dtype)
+    kpts = np.concatenate([kpts, conf], axis=2).reshape(len(cls), -1)
+
+    return np.concatenate([cls, xywhn, kpts], axis=1).astype(np.float32)
+
+
+def result_track_ids(result):
+    """
+    Track IDs of the persons in one ultralytics tracking result, in the same
+    order as result_to_rows, with NO_TRACK for unassigned detections
+    """
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.empty(0, dtype=np.int32)
+    if boxes.id is None:
+        return np.full(len(boxes), NO_TRACK, dtype=np.int32)
+    return boxes.id.cpu().numpy().astype(np.int32)
+
+
+def extract_keypoints(video_paths, model=None, model_path="yolov8n-pose.pt", batch=16,
+                      export_format=None, threads=None, render=False, save_txt=True, imgsz=640, project=None):
+    """
+    Run batched pose inference over videos using the ultralytics streaming
+    result generator, so results are consumed as they are produced instead of
+    being accumulated for the whole video.
+
+    Args:
+        video_paths (list): Paths to (processed) videos
+        model: Loaded YOLO pose model (loaded from model_path if None)
+        model_path (str): Pose model weights
+        batch (int): Frames per inference batch
+        export_format (str): None, 'onnx' or 'openvino'
+        threads (int): Intra-op CPU threads
+        render (bool): Also write the annotated AVI
+        save_txt (bool): Write per-frame label files under runs/pose
+        imgsz (int): Inference image size
+        project (str): Save under project/<video name>/labels instead of a
+            new runs/pose/predictN directory
+
+    Returns:
+        list: Per video, a list of (n_persons, 56) keypoint row arrays, one per frame
+    """
+    if model is None:
+        model = load_pose_model(model_path, export_format=export_format, threads=threads, imgsz=imgsz)
+    threads = threads or getattr(model, "inference_threads", None)
+
+    all_rows = []
+    total_frames = 0
+    total_start = time.perf_counter()
+
+    for video in video_paths:
+        start = time.perf_counter()
+        video_rows = []
+        save_dir = {}
+        if project is not None:
+            save_dir = {'project': project, 'name': os.path.splitext(os.path.basename(video))[0], 'exist_ok': True}
+        results = model.predict(
+            source=video,
+            stream=True,
+            batch=batch,
+            imgsz=imgsz,
+            device="cpu",
+            save=render,
+            save_txt=save_txt,
+            verbose=False,
+            **save_dir,
+        )
+        for result in results:
+            _tune_backend_threads(model, threads)
+            video_rows.append(result_to_rows(result))
+
+        elapsed = time.perf_counter() - start
+        metrics.observe('inference', elapsed)
+        metrics.increment('frames_inferred', len(video_rows))
+        total_frames += len(video_rows)
+        all_rows.append(video_rows)
+        print(f"{video}: {len(video_rows)} frames in {elapsed:.2f}s "
+              f"({len(video_rows) / elapsed:.1f} frames/s)")
+
+    total_elapsed = time.perf_counter() - total_start
+    if total_elapsed > 0:
+        print(f"Throughput: {total_frames / total_elapsed:.1f} frames/s over {total_frames} frames")
+
+    return all_rows
+
+
+def track_keypoints(video_paths, model=None, model_path="yolov8n-pose.pt", output_dir="keypoints",
+                    tracker="bytetrack.yaml", export_format=None, threads=None, save_txt=False, imgsz=640):
+    """
+    Run pose inference with multi-object tracking and write one keypoint
+    store per video holding every person, with a (frames, persons) track_id
+    array, so every track can be featurised and compared from a single
+    inference pass.
+
+    Args:
+        video_paths (list): Paths to (processed) videos
+        model: Loaded YOLO pose model (loaded from model_path if None)
+        model_path (str): Pose model weights
+        output_dir (str): Directory for the .gkp stores
+        tracker (str): ultralytics tracker config, 'bytetrack.yaml' or 'botsort.yaml'
+        export_format (str): None, 'onnx' or 'openvino'
+        threads (int): Intra-op CPU threads
+        save_txt (bool): Also write label files (with the track ID as a 57th column)
+        imgsz (int): Inference image size
+
+    Returns:
+        list: Paths of the written store files
+    """
+    if model is None:
+        model = load_pose_model(model_path, export_format=export_format, threads=threads, imgsz=imgsz)
+    threads = threads or getattr(model, "inference_threads", None)
+    os.makedirs(output_dir, exist_ok=True)
+
+    written = []
+    for video in video_paths:
+        start = time.perf_counter()
+        frame_rows = []
+        frame_track_ids = []
+        # One track call per video with persist=False gives each video fresh track IDs
+        results = model.track(
+            source=video,
+            stream=True,
+            persist=False,
+            tracker=tracker,
+            imgsz=imgsz,
+            device="cpu",
+            save_txt=save_txt,
+            verbose=False,
+        )
+        for result in results:
+            _tune_backend_threads(model, threads)
+            frame_rows.append(result_to_rows(result))
+            frame_track_ids.append(result_track_ids(result))
+
+        rows = pack_frame_rows(frame_rows)
+        output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(video))[0] + STORE_EXTENSION)
+        write_keypoint_store(
+            output_path,
+            rows,
+            np.arange(len(frame_rows)),
+            metadata={'video': os.path.abspath(video), 'model': model_path, 'tracker': tracker},
+            track_id=pack_frame_track_ids(frame_track_ids, rows.shape[1]),
+        )
+        written.append(output_path)
+
+        elapsed = time.perf_counter() - start
+        metrics.observe('inference', elapsed)
+        metrics.increment('frames_inferred', len(frame_rows))
+        tracks = len(np.unique(np.concatenate(frame_track_ids + [np.array([NO_TRACK])]))) - 1
+        print(f"{video}: {len(frame_rows)} frames, {tracks} tracks in {elapsed:.2f}s -> {output_path}")
+
+    return written
+
+
+if __name__ == "__main__":
+    # Specify the path to the video file
+    videos = [os.path.join('processed_videos', f'processed_video{i}.mp4') for i in range(1, 5)]
+
+    extract_keypoints(videos, threads=os.cpu_count())
+
+    print("Keypoint extraction completed.")
@@ -1,5 +1,9 @@
 import cv2
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from instrumentation import metrics
 
 def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6):
     """
@@ -35,7 +39,116 @@ def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6)
             'fps': fps,
             'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         })
-def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6):
+def stream_process_video(video_path, output_path, target_fps, target_frame_count):
+    """
+    Process a single video to match target specifications while holding at
+    most one frame in memory.
+
+    Frames are written as soon as they are decoded. Frames dropped by the FPS
+    decimation are only grabbed, never decoded, and short clips are looped by
+    rewinding the capture instead of keeping earlier frames around.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video file {video_path}")
+
+    out = None
+    written = 0
+    grabbed = 0
+    decoded = 0
+    start = time.perf_counter()
+    try:
+        source_fps = int(cap.get(cv2.CAP_PROP_FPS))
+        if source_fps == 0:
+            raise ValueError(f"Error: Video file {video_path} has an invalid FPS value.")
+        step = max(1, int(source_fps / target_fps))
+
+        while written < target_frame_count:
+            count = 0
+            written_this_pass = 0
+            while written < target_frame_count and cap.grab():
+                grabbed += 1
+                if count % step == 0:
+                    decoded += 1
+                    success, frame = cap.retrieve()
+                    if not success:
+                        break
+                    if out is None:
+                        height, width, _ = frame.shape
+                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                        out = cv2.VideoWriter(output_path, fourcc, target_fps, (width, height))
+                    out.write(frame)
+                    written += 1
+                    written_this_pass += 1
+                count += 1
+
+            if written_this_pass == 0:
+                break
+            # Loop short clips from the start
+            if written < target_frame_count and not cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                raise ValueError(f"Error: Cannot rewind video file {video_path} to loop it")
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+        metrics.increment('frames_decoded', decoded)
+        metrics.increment('frames_skipped', grabbed - decoded, reason='fps_decimation')
+        metrics.observe('preprocess', time.perf_counter() - start)
+
+    if written == 0:
+        raise ValueError(f"No frames extracted from {output_path}")
+
+    return written
+
+
+def _process_video_worker(index, video_path, output_path, target_fps, target_frame_count):
+    """
+    Worker-pool entry point: stream one video and time it
+    """
+    start = time.perf_counter()
+    frame_count = stream_process_video(video_path, output_path, target_fps, target_frame_count)
+    return index, frame_count, time.perf_counter() - start
+
+
+def parallel_preprocess_videos(video_paths, output_dir, target_fps, target_frame_count, workers):
+    """
+    Preprocess each video in its own worker process, reporting progress and
+    errors per video as they finish.
+
+    Returns:
+        list: Frame count of each processed video, in input order
+    """
+    processed_frames = [None] * len(video_paths)
+    errors = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i, video_path in enumerate(video_paths):
+            output_path = os.path.join(output_dir, f"processed_video{i+1}.mp4")
+            future = executor.submit(_process_video_worker, i, video_path, output_path,
+                                     target_fps, target_frame_count)
+            futures[future] = i
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                _, frame_count, elapsed = future.result()
+            except Exception as e:
+                errors[i] = e
+                print(f"[{done}/{len(video_paths)}] Failed video {i+1} ({video_paths[i]}): {e}")
+                continue
+            processed_frames[i] = frame_count
+            print(f"[{done}/{len(video_paths)}] Processed video {i+1}: {frame_count} frames in {elapsed:.2f}s")
+
+    if errors:
+        failed = ", ".join(f"{video_paths[i]} ({errors[i]})" for i in sorted(errors))
+        raise ValueError(f"Error: {len(errors)} of {len(video_paths)} videos failed to process: {failed}")
+
+    return processed_frames
+
+
+def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6, streaming=False,
+                      workers=None):
     """
     Preprocess multiple videos to have the same FPS, duration, and frame count.
     
@@ -44,6 +157,11 @@ def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6)
         output_dir (str): Directory to save processed videos
         target_fps (int): Desired frames per second
         target_duration (int): Desired duration in seconds
+        streaming (bool): Write frames as they are decoded and open one video
+            at a time, keeping memory use constant regardless of clip length
+            or resolution
+        workers (int): Number of worker processes; with more than one, each
+            video is preprocessed in its own process (always streaming)
     """
     # Create output directory if not exists
     os.makedirs(output_dir, exist_ok=True)
@@ -51,6 +169,22 @@ def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6)
     # Calculate target frame count
     target_frame_count = target_fps * target_duration
     
+    if workers is not None and workers > 1:
+        processed_frames = parallel_preprocess_videos(video_paths, output_dir, target_fps,
+                                                      target_frame_count, workers)
+        _report_processed(processed_frames, target_fps, target_duration, output_dir)
+        return
+
+    if streaming:
+        processed_frames = []
+        for i, video_path in enumerate(video_paths):
+            output_path = os.path.join(output_dir, f"processed_video{i+1}.mp4")
+            frame_count = stream_process_video(video_path, output_path, target_fps, target_frame_count)
+            processed_frames.append(frame_count)
+            print(f"Processed video {i+1}: {frame_count} frames")
+        _report_processed(processed_frames, target_fps, target_duration, output_dir)
+        return
+
     # Open all video captures
     caps = []
     for video_path in video_paths:
@@ -118,7 +252,13 @@ def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6)
     for cap in caps:
         cap.release()
     
-    # Verify all videos have the same number of frames
+    _report_processed(processed_frames, target_fps, target_duration, output_dir)
+
+
+def _report_processed(processed_frames, target_fps, target_duration, output_dir):
+    """
+    Verify all videos have the same number of frames and print a summary
+    """
     if len(set(processed_frames)) != 1:
         raise ValueError("Error: Processed videos have different frame counts")
     
@@ -128,14 +268,12 @@ def preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6)
     print(f"Frame count per video: {processed_frames[0]}")
     print(f"Output directory: {output_dir}")
 
-# Example usage
-video_paths = [
-    r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\videos\person1-a.mp4',
-    r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\videos\person1-b.mp4',
-    r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\videos\person2-a.mp4',
-    r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\videos\person2-b.mp4'
-]
+if __name__ == "__main__":
+    # Example usage
+    video_paths = [os.path.join('videos', name) for name in
+                   ('person1-a.mp4', 'person1-b.mp4', 'person2-a.mp4', 'person2-b.mp4')]
 
-output_dir = r'C:\Users\pavan\OneDrive\Desktop\gait anlaysis\forensic-gait-analysis\processed_videos'
+    output_dir = 'processed_videos'
 
-preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6)
+    preprocess_videos(video_paths, output_dir, target_fps=20, target_duration=6, streaming=True,
+                      workers=os.cpu_count())
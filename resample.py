@@ -0,0 +1,199 @@
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from instrumentation import metrics
+from keypoint_store import NUM_KEYPOINTS, STORE_EXTENSION, pack_frame_rows, write_keypoint_store
+
+
+def decode_timed_frames(video_path, max_duration=None):
+    """
+    Yield (frame_index, timestamp, frame) for every frame of a video at its
+    native frame rate, with the decoder's presentation time in seconds.
+
+    Containers that report no or non-increasing timestamps fall back to
+    frame_index / fps for those frames, so timestamps always increase.
+
+    Args:
+        video_path (str): Source video
+        max_duration (float): Stop after this many seconds of video (None for all of it)
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video file {video_path}")
+
+    try:
+        source_fps = cap.get(cv2.CAP_PROP_FPS)
+        if not source_fps:
+            raise ValueError(f"Error: Video file {video_path} has an invalid FPS value.")
+
+        frame_index = 0
+        first = last = None
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if last is not None and timestamp <= last:
+                timestamp = last + 1 / source_fps
+            first = timestamp if first is None else first
+            # Keep one frame past the end so the last grid point can be interpolated
+            yield frame_index, timestamp, frame
+            if max_duration is not None and timestamp - first >= max_duration:
+                break
+            last = timestamp
+            frame_index += 1
+    finally:
+        cap.release()
+
+
+def resample_rows(rows, timestamps, target_fps=20, duration=None):
+    """
+    Resample label rows taken at arbitrary times onto a regular target_fps
+    grid starting at the first timestamp, by linear interpolation between the
+    two nearest source frames.
+
+    A keypoint is only interpolated when it was detected in both source
+    frames; otherwise the nearer frame's value is used, so undetected (0, 0)
+    keypoints and NaN padding are never blended into real positions.
+
+    Args:
+        rows (np.ndarray): (frames, 56) or (frames, persons, 56) label rows
+        timestamps (np.ndarray): (frames,) increasing times in seconds
+        target_fps (float): Rate of the output grid
+        duration (float): Longest span to keep in seconds (None keeps all)
+
+    Returns:
+        tuple: Resampled rows of the same layout and the (grid frames,) grid times
+    """
+    rows = np.asarray(rows, dtype=np.float32)
+    single = rows.ndim == 2
+    if single:
+        rows = rows[:, None, :]
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(rows) != len(timestamps):
+        raise ValueError("Error: rows and timestamps must have one entry per frame")
+    if not len(rows):
+        raise ValueError("Error: No frames to resample")
+
+    span = timestamps[-1] - timestamps[0]
+    count = int(np.floor(span * target_fps + 1e-6)) + 1
+    if duration is not None:
+        count = min(count, int(round(duration * target_fps)))
+    times = timestamps[0] + np.arange(count) / target_fps
+
+    # A single frame clips to after == before == 0
+    after = np.clip(np.searchsorted(timestamps, times, side='right'), 1, len(timestamps) - 1)
+    before = np.maximum(after - 1, 0)
+    gap = timestamps[after] - timestamps[before]
+    weight = np.clip((times - timestamps[before]) / np.where(gap > 0, gap, 1), 0, 1)
+
+    a, b = rows[before], rows[after]
+    resampled = a + weight[:, None, None] * (b - a)
+    nearest = np.where((weight < 0.5)[:, None, None], a, b)
+
+    persons = rows.shape[1]
+    keypoints_a = a[..., 5:].reshape(count, persons, NUM_KEYPOINTS, 3)
+    keypoints_b = b[..., 5:].reshape(count, persons, NUM_KEYPOINTS, 3)
+    detected = (~np.isnan(keypoints_a[..., 0]) & ~np.all(keypoints_a[..., :2] == 0, axis=3)
+                & ~np.isnan(keypoints_b[..., 0]) & ~np.all(keypoints_b[..., :2] == 0, axis=3))
+    both = ~np.isnan(a[..., 0]) & ~np.isnan(b[..., 0])
+
+    resampled[..., :5] = np.where(both[..., None], resampled[..., :5], nearest[..., :5])
+    keypoints = resampled[..., 5:].reshape(count, persons, NUM_KEYPOINTS, 3)
+    nearest_keypoints = nearest[..., 5:].reshape(count, persons, NUM_KEYPOINTS, 3)
+    resampled[..., 5:] = np.where(detected[..., None], keypoints, nearest_keypoints).reshape(count, persons, -1)
+
+    return (resampled[:, 0] if single else resampled), times
+
+
+def extract_resampled_keypoints(video_paths, model=None, model_path="yolov8n-pose.pt", output_dir="keypoints",
+                                target_fps=20, target_duration=None, batch=16, export_format=None, threads=None,
+                                imgsz=640):
+    """
+    Run pose inference on every original frame at the video's native frame
+    rate, then resample the keypoints to target_fps using the frames' real
+    timestamps and write one keypoint store per video.
+
+    This replaces preprocess_videos: nothing is re-encoded, odd rates such as
+    25 or 29.97 fps resample exactly, and short clips are not padded with
+    repeated frames.
+
+    Args:
+        video_paths (list): Original videos
+        model: Loaded YOLO pose model (loaded from model_path if None)
+        model_path (str): Pose model weights
+        output_dir (str): Directory for the .gkp stores
+        target_fps (int): Analysis frame rate
+        target_duration (float): Seconds to keep from the start (None keeps all)
+        batch (int): Frames per inference call
+        export_format (str): None, 'onnx' or 'openvino'
+        threads (int): Intra-op CPU threads
+        imgsz (int): Inference image size
+
+    Returns:
+        list: Paths of the written store files
+    """
+    from pose import load_pose_model, result_to_rows
+
+    if model is None:
+        model = load_pose_model(model_path, export_format=export_format, threads=threads, imgsz=imgsz)
+    os.makedirs(output_dir, exist_ok=True)
+
+    written = []
+    for video in video_paths:
+        start = time.perf_counter()
+        frame_rows, timestamps, frames = [], [], []
+
+        def flush():
+            if frames:
+                with metrics.timer('inference'):
+                    frame_rows.extend(result_to_rows(result) for result in model(frames, imgsz=imgsz, verbose=False))
+                frames.clear()
+
+        for _, timestamp, frame in decode_timed_frames(video, target_duration):
+            timestamps.append(timestamp)
+            frames.append(frame)
+            if len(frames) >= batch:
+                flush()
+        flush()
+        if not frame_rows:
+            raise ValueError(f"No frames extracted from {video}")
+        metrics.increment('frames_decoded', len(frame_rows))
+        metrics.increment('frames_inferred', len(frame_rows))
+
+        rows, times = resample_rows(pack_frame_rows(frame_rows), timestamps, target_fps, target_duration)
+        output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(video))[0] + STORE_EXTENSION)
+        write_keypoint_store(
+            output_path,
+            rows,
+            np.arange(len(rows)),
+            metadata={'video': os.path.abspath(video), 'model': model_path, 'target_fps': target_fps,
+                      'source_frames': len(frame_rows)},
+            timestamp=times - times[0],
+        )
+        written.append(output_path)
+
+        elapsed = time.perf_counter() - start
+        source_fps = (len(timestamps) - 1) / (timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0
+        print(f"{video}: {len(frame_rows)} frames at {source_fps:.2f} fps resampled to {len(rows)} frames "
+              f"at {target_fps} fps in {elapsed:.2f}s -> {output_path}")
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract keypoints at native frame rate and resample them")
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--output-dir', default='keypoints')
+    parser.add_argument('--model', default='yolov8n-pose.pt')
+    parser.add_argument('--fps', type=int, default=20)
+    parser.add_argument('--duration', type=float, help="Seconds to keep from the start of each video")
+    parser.add_argument('--batch', type=int, default=16)
+    args = parser.parse_args()
+
+    extract_resampled_keypoints(args.videos, model_path=args.model, output_dir=args.output_dir,
+                                target_fps=args.fps, target_duration=args.duration, batch=args.batch)
@@ -0,0 +1,114 @@
+import numpy as np
+
+from gait_similarity import LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, RIGHT_ANKLE, RIGHT_HIP, RIGHT_KNEE
+from instrumentation import metrics
+from keypoint_store import NUM_KEYPOINTS
+from pose import result_to_rows
+
+_LEG_JOINTS = [LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE]
+
+
+def crop_region(box, frame_shape, margin=0.5, min_size=64):
+    """
+    Pixel region (x0, y0, x1, y1) around a normalised xywh box, enlarged by
+    margin times the box size on every side and clipped to the frame
+    """
+    height, width = frame_shape[:2]
+    cx, cy, w, h = box
+    half_w = max(w * (0.5 + margin) * width, min_size / 2)
+    half_h = max(h * (0.5 + margin) * height, min_size / 2)
+    x0 = int(max(0, cx * width - half_w))
+    y0 = int(max(0, cy * height - half_h))
+    x1 = int(min(width, cx * width + half_w))
+    y1 = int(min(height, cy * height + half_h))
+    return x0, y0, x1, y1
+
+
+def map_rows_to_frame(rows, region, frame_shape):
+    """
+    Convert label rows normalised to a crop into rows normalised to the full
+    frame. Undetected keypoints keep their (0, 0) marker.
+    """
+    rows = np.array(rows, dtype=np.float32)
+    if not len(rows):
+        return rows
+    height, width = frame_shape[:2]
+    x0, y0, x1, y1 = region
+    scale = np.array([(x1 - x0) / width, (y1 - y0) / height], dtype=np.float32)
+    offset = np.array([x0 / width, y0 / height], dtype=np.float32)
+
+    rows[:, 1:3] = rows[:, 1:3] * scale + offset
+    rows[:, 3:5] *= scale
+    keypoints = rows[:, 5:].reshape(len(rows), NUM_KEYPOINTS, 3)
+    detected = ~np.all(keypoints[..., :2] == 0, axis=2)
+    keypoints[..., :2] = np.where(detected[..., None], keypoints[..., :2] * scale + offset, 0)
+    return rows
+
+
+class RoiPoseRunner:
+    """
+    Pose inference on a crop around the subject instead of the whole frame.
+
+    The first frame, every redetect_interval-th frame, and any frame where
+    the crop loses the person or the leg keypoints fall below min_confidence
+    are inferred on the full frame at full_imgsz. All other frames are
+    cropped to the last known box enlarged by margin and inferred at the
+    smaller roi_imgsz. Rows are returned in full-frame normalised
+    coordinates, exactly as full-frame inference would give them.
+    """
+
+    def __init__(self, model, margin=0.5, roi_imgsz=320, full_imgsz=640, redetect_interval=30,
+                 min_confidence=0.5):
+        """
+        Args:
+            model: Loaded YOLO pose model
+            margin (float): Crop padding on each side, as a fraction of the box size
+            roi_imgsz (int): Inference size for crops
+            full_imgsz (int): Inference size for full-frame detections
+            redetect_interval (int): Frames between forced full-frame detections
+            min_confidence (float): Mean leg keypoint confidence below which
+                a crop result is discarded and the frame is re-detected
+        """
+        self.model = model
+        self.margin = margin
+        self.roi_imgsz = roi_imgsz
+        self.full_imgsz = full_imgsz
+        self.redetect_interval = redetect_interval
+        self.min_confidence = min_confidence
+        self.reset()
+
+    def reset(self):
+        """Forget the subject's position, e.g. at the start of a new video"""
+        self.box = None
+        self._since_full = 0
+
+    def _full_frame(self, frame):
+        metrics.increment('roi_inferences', mode='full')
+        self._since_full = 0
+        return result_to_rows(self.model([frame], imgsz=self.full_imgsz, verbose=False)[0])
+
+    def _leg_confidence(self, rows):
+        keypoints = rows[0, 5:].reshape(NUM_KEYPOINTS, 3)
+        return float(keypoints[_LEG_JOINTS, 2].mean())
+
+    def infer(self, frame):
+        """
+        Pose rows for one frame, (n_persons, 56) in full-frame coordinates
+        """
+        rows = None
+        if self.box is not None and self._since_full < self.redetect_interval:
+            region = crop_region(self.box, frame.shape, self.margin)
+            x0, y0, x1, y1 = region
+            metrics.increment('roi_inferences', mode='crop')
+            crop_rows = result_to_rows(self.model([frame[y0:y1, x0:x1]], imgsz=self.roi_imgsz, verbose=False)[0])
+            if len(crop_rows) and self._leg_confidence(crop_rows) >= self.min_confidence:
+                rows = map_rows_to_frame(crop_rows, region, frame.shape)
+                self._since_full += 1
+            else:
+                metrics.increment('roi_redetections', reason='lost' if not len(crop_rows) else 'low_confidence')
+
+        if rows is None:
+            rows = self._full_frame(frame)
+
+        self.box = rows[0, 1:5].copy() if len(rows) else None
+        return rows
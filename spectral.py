@@ -0,0 +1,96 @@
+import numpy as np
+
+# Largest alignment shift as a fraction of the shorter sequence
+DEFAULT_MAX_SHIFT = 0.5
+# Harmonics of the stride frequency summed for the harmonic ratio
+HARMONICS = 10
+# Shortest plausible stride in frames (two steps of MIN_STEP_FRAMES)
+MIN_STRIDE_FRAMES = 8
+# Zero-padding factor, giving finer frequency bins on short sequences
+_PADDING = 8
+
+
+def _fft_size(n):
+    return 1 << max(int(n) - 1, 1).bit_length()
+
+
+def _standardize(features):
+    features = np.asarray(features, dtype=np.float64)
+    std = features.std(axis=0)
+    std[std == 0] = 1
+    return (features - features.mean(axis=0)) / std
+
+
+def cross_correlation_lag(features1, features2, max_shift=DEFAULT_MAX_SHIFT):
+    """
+    Shift between two feature sequences that best lines them up, from the
+    FFT cross-correlation of their standardised features, in O(n log n)
+    instead of scoring every shift.
+
+    Correlations are summed, not averaged, over the overlapping frames. A
+    periodic gait correlates equally well one stride further on, and the sum
+    then prefers the shift that keeps the most frames to compare. Shifts are
+    also limited to max_shift of the shorter sequence.
+
+    Returns:
+        int: lag such that frame t + lag of features1 pairs with frame t of features2
+    """
+    a, b = _standardize(features1), _standardize(features2)
+    n, m = len(a), len(b)
+    size = _fft_size(n + m - 1)
+    spectrum = (np.fft.rfft(a, size, axis=0) * np.conj(np.fft.rfft(b, size, axis=0))).sum(axis=1)
+    correlation = np.fft.irfft(spectrum, size)
+
+    limit = int(max_shift * min(n, m))
+    lags = np.arange(-min(limit, m - 1), min(limit, n - 1) + 1)
+    return int(lags[np.argmax(correlation[lags % size])])
+
+
+def shift_sequences(features1, features2, lag):
+    """The overlapping frames of two sequences paired at a cross_correlation_lag"""
+    if lag >= 0:
+        features1 = features1[lag:]
+    else:
+        features2 = features2[-lag:]
+    length = min(len(features1), len(features2))
+    return features1[:length], features2[:length]
+
+
+def spectral_features(features):
+    """
+    Dominant stride frequency and harmonic ratio of a (frames, 4) feature
+    sequence.
+
+    Each knee angle swings once per stride, so the peak of their summed power
+    spectrum gives the stride frequency. The step length peaks once per step,
+    at the even harmonics of the stride frequency; its odd harmonics come from
+    differences between left and right steps. The harmonic ratio, even over
+    odd harmonic amplitude, is therefore high for a symmetric gait.
+
+    Returns:
+        tuple: (stride frequency in cycles per frame, harmonic ratio), NaN
+            where the sequence is too short or shows no periodicity
+    """
+    features = np.asarray(features, dtype=np.float64)
+    n = len(features)
+    if n < 2 * MIN_STRIDE_FRAMES:
+        return np.nan, np.nan
+
+    size = _fft_size(_PADDING * n)
+    frequencies = np.fft.rfftfreq(size)
+    knees = features[:, 2:4] - features[:, 2:4].mean(axis=0)
+    power = (np.abs(np.fft.rfft(knees, size, axis=0)) ** 2).sum(axis=1)
+    # At least one full stride within the sequence
+    band = np.flatnonzero((frequencies >= 1 / n) & (frequencies <= 1 / MIN_STRIDE_FRAMES))
+    if not len(band) or power[band].max() == 0:
+        return np.nan, np.nan
+    stride_frequency = frequencies[band[np.argmax(power[band])]]
+
+    amplitude = np.abs(np.fft.rfft(features[:, 0] - features[:, 0].mean(), size))
+    harmonics = np.arange(1, HARMONICS + 1) * stride_frequency
+    harmonics = harmonics[harmonics <= 0.5]
+    # Highest bin within half a main lobe of each harmonic
+    bins = np.round(harmonics * size).astype(int)[:, None] + np.arange(-(_PADDING // 2), _PADDING // 2 + 1)
+    peaks = amplitude[np.clip(bins, 0, len(amplitude) - 1)].max(axis=1)
+    odd, even = peaks[0::2].sum(), peaks[1::2].sum()
+    return stride_frequency, (even / odd if odd > 0 else np.nan)
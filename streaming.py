@@ -0,0 +1,274 @@
+import argparse
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from gait_similarity import FEATURE_NAMES, compute_gait_features, load_sequence_features, sequence_to_keypoints
+from instrumentation import metrics
+from pipeline import _put
+from pose import load_pose_model, result_to_rows
+
+
+def follow_video(path, poll_interval=0.5, idle_timeout=10.0):
+    """
+    Yield (frame_index, frame) from a video file that is still being written.
+
+    At the end of the file the capture is reopened after poll_interval and
+    resumes after the last frame read, so earlier frames are never decoded
+    twice. Stops once no new frame has appeared for idle_timeout seconds.
+    """
+    frame_index = 0
+    last_frame_time = time.monotonic()
+
+    while True:
+        cap = cv2.VideoCapture(path)
+        if cap.isOpened():
+            if frame_index:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            while True:
+                success, frame = cap.read()
+                if not success:
+                    break
+                yield frame_index, frame
+                frame_index += 1
+                last_frame_time = time.monotonic()
+        cap.release()
+
+        if time.monotonic() - last_frame_time > idle_timeout:
+            return
+        time.sleep(poll_interval)
+
+
+def capture_frames(source):
+    """
+    Yield (frame_index, frame) from any live cv2 source, e.g. a camera index
+    or an RTSP URL, until the source ends
+    """
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        raise ValueError(f"Error: Cannot open video source {source}")
+    try:
+        frame_index = 0
+        while True:
+            success, frame = cap.read()
+            if not success:
+                return
+            yield frame_index, frame
+            frame_index += 1
+    finally:
+        cap.release()
+
+
+class RollingStats:
+    """Running mean and standard deviation per feature (Welford's algorithm)"""
+
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self._m2 = np.zeros(n_features)
+
+    def update(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return np.sqrt(self._m2 / self.count) if self.count else np.zeros_like(self.mean)
+
+
+class OnlineGaitMatcher:
+    """
+    Running compare_sequences scores of a growing sequence against one or
+    more reference sequences.
+
+    Each new valid frame costs O(references): the running absolute
+    differences and the growing sequence's running range are updated in
+    place, and the references' prefix ranges are precomputed, so the score
+    after t frames equals compare_sequences(first t frames, reference)
+    without revisiting earlier frames.
+    """
+
+    def __init__(self, references):
+        """
+        Args:
+            references (dict): Reference name -> (frames, 4) feature array
+        """
+        self.names = list(references)
+        lengths = np.array([len(references[name]) for name in self.names])
+        padded = np.full((len(self.names), lengths.max(), len(FEATURE_NAMES)), np.nan)
+        for i, name in enumerate(self.names):
+            padded[i, :lengths[i]] = references[name]
+            # Hold the last value so the prefix range stays defined past the end
+            padded[i, lengths[i]:] = references[name][-1]
+
+        self._references = padded
+        self._lengths = lengths
+        self._prefix_range = np.maximum.accumulate(padded, axis=1) - np.minimum.accumulate(padded, axis=1)
+        self._sum_abs_diff = np.zeros((len(self.names), len(FEATURE_NAMES)))
+        self._max = np.full(len(FEATURE_NAMES), -np.inf)
+        self._min = np.full(len(FEATURE_NAMES), np.inf)
+        self._frozen_range = np.zeros((len(self.names), len(FEATURE_NAMES)))
+
+        self.frames = 0
+        self.stats = RollingStats(len(FEATURE_NAMES))
+
+    def update(self, features):
+        """
+        Add one valid frame's (4,) features and return the current scores
+        """
+        t = self.frames
+        active = t < self._lengths
+        if active.any():
+            self._sum_abs_diff[active] += np.abs(self._references[active, t] - features)
+        self._max = np.maximum(self._max, features)
+        self._min = np.minimum(self._min, features)
+        # Once past a reference's end, compare_sequences truncates to the
+        # reference length, so that reference's score stops changing
+        self._frozen_range[active] = self._max - self._min
+
+        self.frames += 1
+        self.stats.update(features)
+        return self.scores()
+
+    def scores(self):
+        """
+        Current (overall score, detailed metrics) per reference name
+        """
+        if self.frames == 0:
+            return {}
+        compared = np.minimum(self.frames, self._lengths)
+        range_reference = self._prefix_range[np.arange(len(self.names)), compared - 1]
+        range_val = np.maximum(range_reference, self._frozen_range)
+        mean_abs_diff = self._sum_abs_diff / compared[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            differences = np.where(range_val > 0, mean_abs_diff / range_val, 0)
+        similarities = 100 * (1 - differences)
+
+        return {name: (float(similarities[i].mean()), dict(zip(FEATURE_NAMES, similarities[i].tolist())))
+                for i, name in enumerate(self.names)}
+
+
+def _reader(frames, frame_queue, stop, drop_when_behind):
+    try:
+        for item in frames:
+            if stop.is_set():
+                return
+            if drop_when_behind:
+                while True:
+                    try:
+                        frame_queue.put_nowait(item)
+                        break
+                    except queue.Full:
+                        # Drop the oldest frame so a slow consumer stays current
+                        try:
+                            frame_queue.get_nowait()
+                            metrics.increment('frames_dropped', reason='behind_live_source')
+                        except queue.Empty:
+                            pass
+            elif not _put(frame_queue, item, stop):
+                return
+        _put(frame_queue, None, stop)
+    except Exception as e:
+        _put(frame_queue, e, stop)
+
+
+def stream_match(frames, references, model=None, model_path="yolov8n-pose.pt", source_fps=None,
+                 target_fps=20, min_confidence=None, queue_size=8, drop_when_behind=False):
+    """
+    Score a live or growing footage source against reference sequences,
+    yielding an update after every analysed frame.
+
+    Args:
+        frames: Iterator of (frame_index, frame), e.g. follow_video or capture_frames
+        references (dict): Reference name -> (frames, 4) feature array
+        model: Loaded YOLO pose model (loaded from model_path if None)
+        source_fps (float): Source frame rate, used to decimate to target_fps
+        target_fps (int): Analysis frame rate
+        min_confidence (float): Minimum keypoint confidence
+        queue_size (int): Frames buffered between the reader and the matcher
+        drop_when_behind (bool): Drop the oldest buffered frame instead of
+            blocking when analysis falls behind a live source
+
+    Yields:
+        dict: frame_index, valid, frames_matched, latency_seconds, scores,
+            rolling_mean and rolling_std
+    """
+    if model is None:
+        model = load_pose_model(model_path)
+    matcher = OnlineGaitMatcher(references)
+    step = max(1, int(round(source_fps / target_fps))) if source_fps else 1
+
+    frame_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    reader = threading.Thread(target=_reader, args=(frames, frame_queue, stop, drop_when_behind), daemon=True)
+    reader.start()
+
+    try:
+        while True:
+            item = frame_queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            frame_index, frame = item
+            if frame_index % step:
+                continue
+
+            start = time.perf_counter()
+            rows = result_to_rows(model([frame], verbose=False)[0])
+            metrics.increment('frames_inferred')
+            valid = False
+            if len(rows):
+                features, mask = compute_gait_features(sequence_to_keypoints(rows[:1]), min_confidence)
+                valid = bool(mask[0])
+                if valid:
+                    matcher.update(features[0])
+            else:
+                metrics.increment('frames_rejected', reason='no_detection')
+
+            latency = time.perf_counter() - start
+            metrics.observe('stream_update', latency)
+            yield {
+                'frame_index': frame_index,
+                'valid': valid,
+                'frames_matched': matcher.frames,
+                'latency_seconds': latency,
+                'scores': matcher.scores(),
+                'rolling_mean': dict(zip(FEATURE_NAMES, matcher.stats.mean.tolist())),
+                'rolling_std': dict(zip(FEATURE_NAMES, matcher.stats.std.tolist())),
+            }
+    finally:
+        stop.set()
+        reader.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Match a growing video or live source against references")
+    parser.add_argument('source', help="Video file being written, camera index or stream URL")
+    parser.add_argument('references', nargs='+', help="Reference labels folders or keypoint stores")
+    parser.add_argument('--live', action='store_true', help="Treat the source as a live capture")
+    parser.add_argument('--target-fps', type=int, default=20)
+    args = parser.parse_args()
+
+    references = {path: load_sequence_features(path) for path in args.references}
+    if args.live:
+        source = int(args.source) if args.source.isdigit() else args.source
+        frames, drop = capture_frames(source), True
+    else:
+        source, frames, drop = args.source, follow_video(args.source), False
+
+    cap = cv2.VideoCapture(source)
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or None
+    cap.release()
+
+    for update in stream_match(frames, references, source_fps=source_fps, target_fps=args.target_fps,
+                               drop_when_behind=drop):
+        best = max(update['scores'].items(), key=lambda item: item[1][0], default=None)
+        if best:
+            print(f"frame {update['frame_index']}: best {best[0]} {best[1][0]:.2f}% "
+                  f"({update['frames_matched']} frames, {update['latency_seconds'] * 1000:.1f} ms)")
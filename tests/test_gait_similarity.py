@@ -0,0 +1,39 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from gait_similarity import compare_sequences, load_sequence_features, main
+from run_benchmarks import keypoints_to_rows, synthetic_keypoints, write_label_folder
+
+
+class MainTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.labels = []
+        for seed in range(2):
+            labels = os.path.join(self.directory, f'labels{seed}')
+            write_label_folder(labels, keypoints_to_rows(synthetic_keypoints(90, seed=seed)))
+            self.labels.append(labels)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_main_matches_compare_sequences(self):
+        score, detailed_metrics = main(*self.labels, plot=False)
+        expected_score, expected_metrics = compare_sequences(*[load_sequence_features(path) for path in self.labels])
+
+        self.assertAlmostEqual(score, expected_score)
+        self.assertEqual(detailed_metrics.keys(), expected_metrics.keys())
+        for name, value in expected_metrics.items():
+            self.assertAlmostEqual(detailed_metrics[name], value)
+        self.assertLess(score, 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import job_service
+from job_service import JobService, ServiceClient
+from run_benchmarks import keypoints_to_rows, synthetic_keypoints, write_label_folder, write_synthetic_video
+
+
+class RunningService:
+    """A JobService on its own event loop thread, listening on a Unix socket"""
+
+    def __init__(self, directory, **kwargs):
+        self.address = os.path.join(directory, 'service.sock')
+        self.service = JobService(output_root=os.path.join(directory, 'jobs'), **kwargs)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.service.start(self.address), self.loop).result(timeout=30)
+        return ServiceClient(self.address)
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.service.stop(), self.loop).result(timeout=30)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=30)
+        self.loop.close()
+
+
+class JobServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.labels = os.path.join(self.directory, 'labels')
+        write_label_folder(self.labels, keypoints_to_rows(synthetic_keypoints(120)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_compare_job(self):
+        with RunningService(self.directory, process_workers=1) as client:
+            response = client.submit('compare', sequence1=self.labels, sequence2=self.labels)
+            self.assertTrue(response['ok'])
+            status = client.wait(response['job_id'], timeout=60)
+            client.close()
+
+        self.assertEqual(status['state'], 'done')
+        self.assertAlmostEqual(status['result']['score'], 100.0)
+
+    def test_failed_job_reports_error(self):
+        with RunningService(self.directory, process_workers=1) as client:
+            response = client.submit('compare', sequence1=self.labels,
+                                     sequence2=os.path.join(self.directory, 'missing'))
+            status = client.wait(response['job_id'], timeout=60)
+            unknown = client.submit('render')
+            client.close()
+
+        self.assertEqual(status['state'], 'failed')
+        self.assertIn('missing', status['error'])
+        self.assertFalse(unknown['ok'])
+
+    def test_malformed_requests_get_errors(self):
+        with RunningService(self.directory, process_workers=1) as client:
+            responses = [client.request(op='submit', type='compare', params=[1]),
+                         client.request(op='submit', type='extract', params='x'),
+                         client.request(op='submit', type=['compare'], params={}),
+                         client.request(op='status', job_id={}),
+                         client.request(op='submit', type='compare', params={'sequence1': 1, 'sequence2': None})]
+            stats = client.stats()
+            client.close()
+
+        self.assertEqual([response['ok'] for response in responses[:4]], [False] * 4)
+        self.assertIn('params', responses[0]['error'])
+        # Bad paths fail the job, not the connection
+        self.assertTrue(responses[4]['ok'])
+        self.assertTrue(stats['ok'])
+
+    def test_busy_and_cancel(self):
+        release = threading.Event()
+
+        def blocked_compare(params):
+            release.wait(30)
+            return {}
+
+        compare = job_service.JOB_FUNCTIONS['compare']
+        job_service.JOB_FUNCTIONS['compare'] = blocked_compare
+        try:
+            with RunningService(self.directory, process_workers=1, thread_workers=1, max_pending=1) as client:
+                running = client.submit('compare')['job_id']
+                # The only thread worker is busy from here on
+                while client.status(running)['state'] == 'queued':
+                    time.sleep(0.01)
+                queued = client.submit('compare')
+                busy = client.submit('compare')
+                cancelled = client.cancel(queued['job_id'])
+                cancelled_again = client.cancel(queued['job_id'])
+                release.set()
+                status = client.wait(running, timeout=60)
+                client.close()
+        finally:
+            release.set()
+            job_service.JOB_FUNCTIONS['compare'] = compare
+
+        self.assertTrue(queued['ok'])
+        self.assertEqual(busy, {'ok': False, 'error': 'busy', 'pending': 1})
+        self.assertEqual(cancelled['state'], 'cancelled')
+        self.assertFalse(cancelled_again['ok'])
+        self.assertEqual(status['state'], 'done')
+
+    def test_concurrent_jobs_write_separate_outputs(self):
+        video = os.path.join(self.directory, 'walk.mp4')
+        write_synthetic_video(video, synthetic_keypoints(40), (160, 120))
+
+        with RunningService(self.directory, process_workers=2) as client:
+            job_ids = [client.submit('preprocess', videos=[video], target_duration=2)['job_id'] for _ in range(2)]
+            results = [client.wait(job_id, timeout=120) for job_id in job_ids]
+            client.close()
+
+        self.assertEqual([result['state'] for result in results], ['done', 'done'])
+        output_dirs = [result['result']['output_dir'] for result in results]
+        self.assertNotEqual(output_dirs[0], output_dirs[1])
+        for result, job_id in zip(results, job_ids):
+            self.assertEqual(os.path.basename(result['result']['output_dir']), job_id)
+            self.assertTrue(all(os.path.exists(path) for path in result['result']['videos']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import argparse
+import os
+
+import numpy as np
+
+from gait_similarity import compare_sequences, compute_gait_features, load_sequence_features, sequence_to_keypoints
+from keypoint_store import NO_TRACK, is_keypoint_store, open_keypoint_store, pack_frame_rows, pack_frame_track_ids, \
+    read_labels_sequence
+
+# Tracks with fewer valid frames than this are too short to score reliably
+DEFAULT_MIN_FRAMES = 20
+
+
+def load_tracks(path):
+    """
+    Load every person of a tracked sequence, from a keypoint store written by
+    pose.track_keypoints or a labels folder written while tracking.
+
+    Returns:
+        tuple: (frames, persons, 56) rows, (frames, persons) track IDs and
+            (frames,) frame numbers
+    """
+    if is_keypoint_store(path):
+        store = open_keypoint_store(path)
+        if store.track_id is None:
+            raise ValueError(f"Error: {path} has no track IDs, run pose.track_keypoints first")
+        return store.rows, store.track_id, store.frame_index
+
+    frame_rows, frame_track_ids, frame_index = read_labels_sequence(path)
+    rows = pack_frame_rows(frame_rows)
+    return rows, pack_frame_track_ids(frame_track_ids, rows.shape[1]), frame_index
+
+
+def compute_track_features(rows, track_id, frame_index=None, min_confidence=None):
+    """
+    Gait features of every track, from a single compute_gait_features call
+    over all tracked rows of the sequence.
+
+    Args:
+        rows (np.ndarray): (frames, persons, 56) label rows
+        track_id (np.ndarray): (frames, persons) track IDs, NO_TRACK for padding
+        frame_index (np.ndarray): (frames,) frame numbers (defaults to positions)
+        min_confidence (float): Minimum keypoint confidence
+
+    Returns:
+        dict: Track ID -> ((valid frames,) frame numbers, (valid frames, 4) features)
+    """
+    track_id = np.asarray(track_id)
+    frame_index = np.arange(len(track_id)) if frame_index is None else np.asarray(frame_index)
+
+    # Tracked rows in frame order, so each track's rows stay in time order
+    frame_pos, slot = np.nonzero(track_id != NO_TRACK)
+    ids = track_id[frame_pos, slot]
+    features, valid = compute_gait_features(sequence_to_keypoints(rows[frame_pos, slot]), min_confidence)
+
+    order = np.argsort(ids, kind='stable')
+    order = order[valid[order]]
+    track_ids, starts = np.unique(ids[order], return_index=True)
+    return {int(tid): (frame_index[frame_pos[group]], features[group])
+            for tid, group in zip(track_ids, np.split(order, starts[1:]))}
+
+
+def score_tracks(path, reference_features, min_frames=DEFAULT_MIN_FRAMES, min_confidence=None, align=None):
+    """
+    Compare every track of a tracked sequence against a reference sequence.
+
+    Returns:
+        list: Dicts with 'track_id', 'frames', 'first_frame', 'last_frame',
+            'score' and 'detailed_metrics', most similar first. Tracks with
+            fewer than min_frames valid frames are skipped.
+    """
+    rows, track_id, frame_index = load_tracks(path)
+    matches = []
+    for tid, (frames, features) in compute_track_features(rows, track_id, frame_index, min_confidence).items():
+        if len(features) < min_frames:
+            continue
+        score, detailed_metrics = compare_sequences(features, reference_features, align=align)
+        matches.append({
+            'track_id': tid,
+            'frames': len(features),
+            'first_frame': int(frames[0]),
+            'last_frame': int(frames[-1]),
+            'score': float(score),
+            'detailed_metrics': {name: float(value) for name, value in detailed_metrics.items()},
+        })
+
+    matches.sort(key=lambda match: match['score'], reverse=True)
+    return matches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score every tracked person in a scene against a reference")
+    parser.add_argument('scene', help="Tracked keypoint store or labels folder, or a video to track with --track")
+    parser.add_argument('reference', help="Reference labels folder or keypoint store")
+    parser.add_argument('--track', action='store_true', help="Run pose tracking on the scene video first")
+    parser.add_argument('--reference-track', type=int, help="Track ID to use from a tracked reference")
+    parser.add_argument('--min-frames', type=int, default=DEFAULT_MIN_FRAMES)
+    parser.add_argument('--dtw', action='store_true', help="Align each track to the reference with DTW")
+    args = parser.parse_args()
+
+    scene = args.scene
+    if args.track:
+        from pose import track_keypoints
+        scene = track_keypoints([scene], output_dir=os.path.join('keypoints', 'tracks'))[0]
+
+    reference = load_sequence_features(args.reference, track_id=args.reference_track)
+    matches = score_tracks(scene, reference, min_frames=args.min_frames, align='dtw' if args.dtw else None)
+    for rank, match in enumerate(matches, start=1):
+        print(f"\n{rank}. Track {match['track_id']} (frames {match['first_frame']}-{match['last_frame']}, "
+              f"{match['frames']} valid): {match['score']:.2f}%")
+        for feature, score in match['detailed_metrics'].items():
+            print(f"   {feature}: {score:.2f}%")